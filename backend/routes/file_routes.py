@@ -1,16 +1,52 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from ics import Calendar
 from datetime import datetime
 from icalendar import Calendar
 import csv
 import io
+import json
 import os
 import requests
 import logging
+from itertools import chain
+from backend.utils.file_scanner import TIME_FORMATS, TopFiles, iter_files
+from backend.utils.content_types import content_type_summary
+from backend.utils.disk_usage import TREEMAP_MAX_BYTES, directory_usage
+from backend.utils.duplicate_finder import find_duplicate_files
+from backend.utils.estimator import MAX_ESTIMATE_SECONDS, iter_estimates
+from backend.utils.file_watcher import find_watcher, start_watcher, stop_watcher
+from backend.utils.scan_cache import ScanCache, directory_fingerprint
+from backend.utils.scan_filters import compile_name_filter
+from backend.utils.scan_index import ScanIndex
+from backend.utils.checkpoint import checkpoint_path
+from backend.utils.scan_jobs import MAX_PAGE_SIZE, checkpoint_options, get_job, remove_job, resume_jobs, submit_job
+from backend.utils.snapshot_diff import diff_snapshots, write_sorted_snapshot
+from backend.utils.throttle import ScanThrottle
+from backend.utils.trends import RESOLUTIONS, TrendStore
 
 # Initialize Blueprint
 file_bp = Blueprint('file', __name__)
 BASE_API_URL = os.getenv("BASE_API_URL", "http://127.0.0.1:5000")
+SCAN_INDEX_PATH = os.getenv("SCAN_INDEX_PATH", "scan_index.db")
+# Per-directory and per-extension totals recorded after whole-tree scans, served by /trends
+TRENDS_PATH = os.getenv("TRENDS_PATH", "scan_trends.db")
+# Walk frontiers of checkpointed background scans, kept until each scan completes
+SCAN_CHECKPOINT_DIR = os.getenv("SCAN_CHECKPOINT_DIR", "scan_checkpoints")
+# Sorted snapshots written by /snapshots/sorted and compared by /diff; clients only name them
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+# Most walker threads one scan request may ask for; larger requests are clamped
+MAX_WORKERS = int(os.getenv("SCAN_MAX_WORKERS", 32))
+
+# Cache of /scan responses for dashboards that repeat the same request
+scan_cache = ScanCache(
+    max_entries=int(os.getenv("SCAN_CACHE_SIZE", 128)),
+    ttl=float(os.getenv("SCAN_CACHE_TTL", 300)),
+)
+# Rolled-up DiskUsage per directory, so treemap drill-downs do not walk the tree again
+usage_cache = ScanCache(
+    max_entries=int(os.getenv("USAGE_CACHE_SIZE", 16)),
+    ttl=float(os.getenv("USAGE_CACHE_TTL", 600)),
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -114,6 +150,125 @@ def process_events(events):
 
     return {"successes": successes, "errors": errors}
 
+# Helper Function: Files Under a Scan Root
+def scan_files(directory, extensions, workers=1, ordered=True, incremental=False, with_stat=False, throttle=None,
+               walk_options=None):
+    """Yield (file name, file path, stat callable) for every file a scan should look at.
+
+    walk_options holds the iter_files symlink and filesystem flags.
+    """
+    def accept(file):
+        return not extensions or any(file.lower().endswith(ext) for ext in extensions)
+
+    # A live inventory already knows every file, so the disk is not walked; its records stand in for stat
+    entries = inventory_entries(directory, walk_options, exclude_hidden=False, exclude_pyc=False,
+                                exclude_init=False, exclude_dirs=())
+    if entries is not None:
+        for file_path, record in entries:
+            file = os.path.basename(file_path)
+            if accept(file):
+                yield file, file_path, lambda record=record: record
+        return
+
+    index = ScanIndex(SCAN_INDEX_PATH) if incremental else None
+    try:
+        for entry in iter_files(directory, accept=accept, exclude_dirs=(), workers=workers,
+                                ordered=ordered, prefetch_stat=with_stat, index=index, throttle=throttle,
+                                **(walk_options or {})):
+            yield entry.name, entry.path, entry.stat
+    finally:
+        if index is not None:
+            index.close()
+
+# Helper Function: Inventory Entries
+def inventory_entries(directory, options=None, **filters):
+    """(file path, stat) pairs of directory from a live inventory covering it, or None to walk the disk.
+
+    options are walk_options: the inventory neither follows symlinks nor
+    stops at filesystem boundaries, so those requests still walk. filters
+    are the InventoryWatcher.entries name and size filters.
+    """
+    if options and (options['follow_symlinks'] or options['one_filesystem']):
+        return None
+    watcher = find_watcher(directory)
+    return watcher.entries(directory, **filters) if watcher is not None else None
+
+# Helper Function: Usage Path
+def usage_path(usage, path):
+    """The DiskUsage node a request's path names, in the form of the usage root.
+
+    path may be absolute, relative to the working directory like the
+    scanned directory, or relative to the usage root as treemap drill-down
+    builds it.
+    """
+    if path is None:
+        return None
+    if not os.path.isabs(path):
+        if os.path.normpath(path) in usage.totals:
+            return os.path.normpath(path)
+        path = os.path.join(usage.root, path)
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(usage.root))
+    if relative == os.curdir:
+        return usage.root
+    return path if relative.startswith(os.pardir) else os.path.join(usage.root, relative)
+
+# Helper Function: Walk Options
+def walk_options(params, parse=bool):
+    """Symlink and filesystem flags of a request, as iter_files keyword arguments."""
+    return {
+        option: parse(params.get(option, False))
+        for option in ('follow_symlinks', 'one_filesystem', 'per_mount')
+    }
+
+# Helper Function: Parse Scanned Files
+def parse_scanned_files(files, top=None):
+    """Parse calendar files as the walk finds them, yielding ("event" | "error", payload)."""
+    for file, file_path, stat in files:
+        if top is not None:
+            try:
+                top.push(file_path, stat())
+            except OSError:
+                pass
+        if file.lower().endswith(".ics"):
+            events = parse_ics(file_path)
+            if isinstance(events, list):
+                for event in events:
+                    yield "event", event
+            else:
+                yield "error", {"file": file, "error": events.get("error")}
+        # Handle other extensions like CSV if needed here
+
+def stream_scan_results(directory, files, top, time_format):
+    """Render a scan as NDJSON: one line per parsed event, then a summary trailer."""
+    counts = {"files": 0, "events": 0}
+    errors = []
+
+    def counted(files):
+        for item in files:
+            counts["files"] += 1
+            yield item
+
+    try:
+        for kind, payload in parse_scanned_files(counted(files), top):
+            if kind == "event":
+                counts["events"] += 1
+                yield json.dumps({"type": "event", "event": payload}, default=str) + "\n"
+            else:
+                errors.append(payload)
+    except Exception as e:
+        errors.append({"error": f"Failed to scan and parse directory: {str(e)}"})
+
+    trailer = {
+        "type": "summary",
+        "message": f"Scanned and parsed files in {directory}",
+        "files_scanned": counts["files"],
+        "events_parsed": counts["events"],
+        "errors": errors,
+    }
+    if top is not None:
+        trailer["top_files"] = top.results(time_format)
+    yield json.dumps(trailer, default=str) + "\n"
+
 # Route: Scan Directory
 @file_bp.route('/scan', methods=['POST'])
 def scan_directory():
@@ -121,37 +276,606 @@ def scan_directory():
     data = request.json
     directory = data.get('directory')
     extensions = data.get('extensions', [])
+    ordered = data.get('ordered', True)
+    incremental = data.get('incremental', False)
 
     if not directory:
         return jsonify({"error": "Directory is required"}), 400
 
+    workers = parse_workers(data.get('workers', 1))
+    if workers is None:
+        return jsonify({"error": "workers must be an integer"}), 400
+
     if not os.path.exists(directory) or not os.path.isdir(directory):
         return jsonify({"error": "Directory does not exist or is not accessible"}), 400
 
+    time_format = data.get('time_format', 'default')
+    if time_format not in TIME_FORMATS:
+        return jsonify({"error": f"Unsupported time format: {time_format}"}), 400
+
+    # Optional top-k ranking computed during the same walk, e.g. {"top": 100, "sort_by": "file_size"}
+    top = None
+    if 'top' in data:
+        try:
+            top = TopFiles(int(data['top']), data.get('sort_by', 'file_size'), data.get('order', 'desc') != 'asc')
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+
+    if incremental and data.get('follow_symlinks'):
+        return jsonify({"error": "follow_symlinks cannot be combined with incremental scans"}), 400
+
+    # Optional I/O limits, e.g. {"throttle": {"stats_per_second": 2000, "idle_priority": true}}
+    try:
+        throttle = ScanThrottle.from_options(data.get('throttle'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    files = scan_files(directory, extensions, workers, ordered, incremental, with_stat=top is not None,
+                       throttle=throttle, walk_options=walk_options(data))
+
+    # Streaming mode sends events while the walk is still running
+    if data.get('stream') or request.accept_mimetypes.best == 'application/x-ndjson':
+        return Response(
+            stream_with_context(stream_scan_results(directory, files, top, time_format)),
+            mimetype='application/x-ndjson',
+        )
+
+    # Everything that changes the response body, in canonical form
+    use_cache = data.get('cache', True)
+    cache_params = {
+        "extensions": sorted(ext.lower() for ext in extensions),
+        "ordered": bool(ordered),
+        **walk_options(data),
+        "time_format": time_format,
+        "top": int(data['top']) if top is not None else None,
+        "sort_by": data.get('sort_by', 'file_size') if top is not None else None,
+        "order": data.get('order', 'desc') if top is not None else None,
+    }
+    if use_cache:
+        cached = scan_cache.get(directory, cache_params)
+        if cached is not None:
+            return jsonify(cached), 200
+        fingerprint = directory_fingerprint(directory)
+
     parsed_events = []
     errors = []
 
     try:
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                if not extensions or any(file.lower().endswith(ext) for ext in extensions):
-                    file_path = os.path.join(root, file)
-                    if file.lower().endswith(".ics"):
-                        events = parse_ics(file_path)
-                        if isinstance(events, list):
-                            parsed_events.extend(events)
-                        else:
-                            errors.append({"file": file, "error": events.get("error")})
-                    # Handle other extensions like CSV if needed here
+        for kind, payload in parse_scanned_files(files, top):
+            if kind == "event":
+                parsed_events.append(payload)
+            else:
+                errors.append(payload)
 
-        return jsonify({
+        result = {
             "message": f"Scanned and parsed files in {directory}",
             "parsed_events": parsed_events,
             "errors": errors,
-        }), 200
+            **({"top_files": top.results(time_format)} if top is not None else {}),
+        }
+        if use_cache:
+            scan_cache.put(directory, cache_params, result, fingerprint)
+        return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": f"Failed to scan and parse directory: {str(e)}"}), 500
 
+# Route: Scan Cache
+@file_bp.route('/scan/cache', methods=['GET'])
+def get_scan_cache_stats():
+    """Hit and miss counters of the /scan result cache."""
+    return jsonify(scan_cache.stats()), 200
+
+@file_bp.route('/scan/cache', methods=['DELETE'])
+def clear_scan_cache():
+    scan_cache.clear()
+    return jsonify({"message": "Scan cache cleared"}), 200
+
+# Route: Background Scan Jobs
+@file_bp.route('/scan/jobs', methods=['POST'])
+def create_scan_job():
+    """Start a scan on the background executor and return its job id."""
+    data = request.json or {}
+    directory = data.get('directory')
+
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory does not exist or is not accessible"}), 400
+
+    workers = parse_workers(data.get('workers', 1))
+    if workers is None:
+        return jsonify({"error": "workers must be an integer"}), 400
+
+    try:
+        throttle = ScanThrottle.from_options(data.get('throttle'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    extensions = [ext.lower() for ext in data.get('extensions', [])]
+    scan_options = {
+        "extensions": extensions or None,
+        "min_size": data.get('min_size'),
+        "max_size": data.get('max_size'),
+        "include": data.get('include'),
+        "exclude": data.get('exclude'),
+        "workers": workers,
+        "ordered": data.get('ordered', True),
+        "throttle": throttle,
+        **walk_options(data),
+    }
+
+    # Checkpointed scans survive crashes and restarts: submitting the same scan again resumes it
+    checkpoint = None
+    if data.get('checkpoint'):
+        if data.get('incremental') or scan_options['follow_symlinks'] or scan_options['per_mount']:
+            return jsonify({
+                "error": "checkpoint cannot be combined with incremental, follow_symlinks or per_mount"
+            }), 400
+        os.makedirs(SCAN_CHECKPOINT_DIR, exist_ok=True)
+        checkpoint = checkpoint_path(directory, SCAN_CHECKPOINT_DIR, checkpoint_options(scan_options))
+
+    job = submit_job(directory, scan_options, SCAN_INDEX_PATH if data.get('incremental') else None,
+                     dedupe_hardlinks=data.get('dedupe_hardlinks', True),
+                     trends_path=TRENDS_PATH if data.get('record_trends', True) else None,
+                     checkpoint_path=checkpoint)
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+@file_bp.route('/scan/jobs/resume', methods=['POST'])
+def resume_scan_jobs():
+    """Restart every checkpointed scan left unfinished, e.g. after the server restarted."""
+    if not os.path.isdir(SCAN_CHECKPOINT_DIR):
+        return jsonify({"jobs": []}), 200
+    jobs = resume_jobs(SCAN_CHECKPOINT_DIR, trends_path=TRENDS_PATH)
+    return jsonify({
+        "jobs": [{"job_id": job.id, "directory": job.directory, "status": job.status} for job in jobs],
+    }), 202
+
+@file_bp.route('/scan/jobs/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    """Report the progress of a background scan."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.progress()), 200
+
+@file_bp.route('/scan/jobs/<job_id>/results', methods=['GET'])
+def get_scan_job_results(job_id):
+    """Page through the files found by a completed background scan."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status != "completed":
+        return jsonify({"error": f"Job is {job.status}; results are available once it completes"}), 409
+
+    try:
+        page = int(request.args.get("page", 1))
+        size = int(request.args.get("size", 100))
+    except ValueError:
+        return jsonify({"error": "page and size must be integers"}), 400
+    if page < 1 or not 1 <= size <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"page must be at least 1 and size between 1 and {MAX_PAGE_SIZE}"}), 400
+    time_format = request.args.get('time_format', 'default')
+    if time_format not in TIME_FORMATS:
+        return jsonify({"error": f"Unsupported time format: {time_format}"}), 400
+
+    return jsonify({
+        "files": job.page(page, size, time_format),
+        "total": job.files_matched,
+        "errors": job.errors,
+        "total_errors": job.error_count,
+        "page": page,
+        "size": size,
+    }), 200
+
+@file_bp.route('/scan/jobs/<job_id>', methods=['DELETE'])
+def cancel_scan_job(job_id):
+    """Cancel a running scan, or discard a finished one."""
+    job = remove_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.progress()), 200
+
+# Route: Disk Usage
+@file_bp.route('/usage', methods=['GET'])
+def get_disk_usage():
+    """Recursive size and file count per directory, largest children first."""
+    directory = request.args.get('directory')
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory does not exist or is not accessible"}), 400
+
+    try:
+        depth = int(request.args.get('depth', 2))
+        top = int(request.args.get('top', 10))
+        workers = parse_workers(request.args.get('workers', 1))
+    except ValueError:
+        return jsonify({"error": "depth, top and workers must be integers"}), 400
+    if workers is None:
+        return jsonify({"error": "workers must be an integer"}), 400
+    if depth < 0 or top < 0:
+        return jsonify({"error": "depth and top must not be negative"}), 400
+
+    options = walk_options(request.args, lambda value: value == 'true')
+    entries = inventory_entries(directory, options)
+    index = ScanIndex(SCAN_INDEX_PATH) if request.args.get('incremental') == 'true' and entries is None else None
+    try:
+        usage = directory_usage(directory, workers=workers, index=index,
+                                dedupe_hardlinks=request.args.get('dedupe_hardlinks') == 'true',
+                                entries=entries, **options)
+    except Exception as e:
+        return jsonify({"error": f"Failed to compute disk usage: {str(e)}"}), 500
+    finally:
+        if index is not None:
+            index.close()
+
+    path = usage_path(usage, request.args.get('path'))
+    tree = usage.tree(path, depth=depth, top=top)
+    if tree is None:
+        return jsonify({"error": f"No files found under {path}"}), 404
+    return jsonify({"usage": tree, "hardlinks_skipped": usage.hardlinks_skipped}), 200
+
+# Route: Treemap
+@file_bp.route('/treemap', methods=['GET'])
+def get_treemap():
+    """Size-bounded disk usage tree for treemap views, with drill-down by path."""
+    directory = request.args.get('directory')
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory does not exist or is not accessible"}), 400
+
+    try:
+        depth = int(request.args.get('depth', 4))
+        top = int(request.args.get('top', 12))
+        workers = parse_workers(request.args.get('workers', 1))
+        max_bytes = min(int(request.args.get('max_bytes', TREEMAP_MAX_BYTES)), TREEMAP_MAX_BYTES)
+    except ValueError:
+        return jsonify({"error": "depth, top, workers and max_bytes must be integers"}), 400
+    if workers is None:
+        return jsonify({"error": "workers must be an integer"}), 400
+    if depth < 0 or top < 0:
+        return jsonify({"error": "depth and top must not be negative"}), 400
+
+    # Rollups are computed once per directory and reused for every drill-down below it
+    usage_params = {
+        "incremental": request.args.get('incremental') == 'true',
+        "dedupe_hardlinks": request.args.get('dedupe_hardlinks') == 'true',
+        **walk_options(request.args, lambda value: value == 'true'),
+    }
+    usage = None if request.args.get('refresh') == 'true' else usage_cache.get(directory, usage_params)
+    if usage is None:
+        fingerprint = directory_fingerprint(directory)
+        options = walk_options(request.args, lambda value: value == 'true')
+        entries = inventory_entries(directory, options)
+        index = ScanIndex(SCAN_INDEX_PATH) if usage_params["incremental"] and entries is None else None
+        try:
+            usage = directory_usage(directory, workers=workers, index=index,
+                                    dedupe_hardlinks=usage_params["dedupe_hardlinks"],
+                                    entries=entries, **options)
+        except Exception as e:
+            return jsonify({"error": f"Failed to compute disk usage: {str(e)}"}), 500
+        finally:
+            if index is not None:
+                index.close()
+        usage_cache.put(directory, usage_params, usage, fingerprint)
+
+    path = usage_path(usage, request.args.get('path'))
+    treemap = usage.treemap(path, depth=depth, top=top, max_bytes=max_bytes)
+    if treemap is None:
+        return jsonify({"error": f"No files found under {path}"}), 404
+    return jsonify({"root": usage.root, "treemap": treemap, "hardlinks_skipped": usage.hardlinks_skipped}), 200
+
+# Route: Estimated Usage
+@file_bp.route('/estimate', methods=['GET'])
+def estimate_usage():
+    """Approximate size and type breakdown of a tree from random directory samples."""
+    directory = request.args.get('directory')
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory does not exist or is not accessible"}), 400
+
+    try:
+        seconds = float(request.args.get('seconds', 3))
+        interval = float(request.args.get('interval', 0.5))
+        seed = int(request.args['seed']) if 'seed' in request.args else None
+        confidence = float(request.args.get('confidence', 0.95))
+        top = int(request.args.get('top', 20))
+    except ValueError:
+        return jsonify({"error": "seconds, interval, seed, confidence and top must be numbers"}), 400
+    if not 0 < confidence < 1:
+        return jsonify({"error": "confidence must be between 0 and 1"}), 400
+    if not interval > 0:
+        return jsonify({"error": "interval must be positive"}), 400
+    if not 0 <= seconds <= MAX_ESTIMATE_SECONDS:
+        return jsonify({"error": f"seconds must be between 0 and {MAX_ESTIMATE_SECONDS}"}), 400
+
+    estimates = iter_estimates(directory, seconds=seconds, interval=interval, seed=seed,
+                               confidence=confidence, top=top)
+
+    # Streaming mode sends every refinement as it is computed, ending with the final estimate
+    if request.args.get('stream') == 'true' or request.accept_mimetypes.best == 'application/x-ndjson':
+        return Response(
+            stream_with_context(json.dumps(estimate) + "\n" for estimate in estimates),
+            mimetype='application/x-ndjson',
+        )
+
+    for estimate in estimates:
+        pass
+    return jsonify(estimate), 200
+
+# Route: Content Types
+@file_bp.route('/content-types', methods=['POST'])
+def get_content_types():
+    """Group files by the type their first bytes reveal and list files whose extension disagrees."""
+    data = request.json or {}
+    directory = data.get('directory')
+    extensions = [ext.lower() for ext in data.get('extensions', [])]
+
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory does not exist or is not accessible"}), 400
+
+    workers = parse_workers(data.get('workers', 8))
+    if workers is None:
+        return jsonify({"error": "workers must be an integer"}), 400
+
+    # Sniffed types are cached in the scan index unless turned off; the walk itself always stats afresh
+    index = ScanIndex(SCAN_INDEX_PATH) if data.get('incremental', True) else None
+    try:
+        summary = content_type_summary(
+            directory,
+            workers=workers,
+            index=index,
+            examples=int(data.get('examples', 20)),
+            extensions=extensions or None,
+        )
+    except Exception as e:
+        return jsonify({"error": f"Failed to detect content types: {str(e)}"}), 500
+    finally:
+        if index is not None:
+            index.close()
+
+    return jsonify({"directory": directory, **summary}), 200
+
+# Route: Duplicate Files
+@file_bp.route('/duplicates', methods=['POST'])
+def find_duplicates():
+    """Find groups of identical files under a directory."""
+    data = request.json or {}
+    directory = data.get('directory')
+    extensions = [ext.lower() for ext in data.get('extensions', [])]
+
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory does not exist or is not accessible"}), 400
+
+    workers = parse_workers(data.get('workers', os.cpu_count() or 1))
+    if workers is None:
+        return jsonify({"error": "workers must be an integer"}), 400
+
+    try:
+        throttle = ScanThrottle.from_options(data.get('throttle'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        groups = list(find_duplicate_files(
+            directory,
+            workers=workers,
+            extensions=extensions or None,
+            min_size=data.get('min_size'),
+            throttle=throttle,
+            entries=inventory_entries(directory, extensions=extensions or None, min_size=data.get('min_size')),
+        ))
+    except Exception as e:
+        return jsonify({"error": f"Failed to find duplicates: {str(e)}"}), 500
+
+    groups.sort(key=lambda group: group["wasted_bytes"], reverse=True)
+    return jsonify({
+        "directory": directory,
+        "duplicates": groups,
+        "total_groups": len(groups),
+        "wasted_bytes": sum(group["wasted_bytes"] for group in groups),
+    }), 200
+
+# Route: Snapshot Diffs
+@file_bp.route('/snapshots/sorted', methods=['POST'])
+def create_sorted_snapshot():
+    """Write a path-sorted snapshot of a directory that /diff can compare against a later one."""
+    data = request.json or {}
+    directory = data.get('directory')
+    output = data.get('output')
+    extensions = [ext.lower() for ext in data.get('extensions', [])]
+
+    if not directory or not output:
+        return jsonify({"error": "Directory and output are required"}), 400
+
+    output_path = snapshot_path(output)
+    if output_path is None:
+        return jsonify({"error": f"Invalid snapshot name: {output}"}), 400
+
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory does not exist or is not accessible"}), 400
+
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        count = write_sorted_snapshot(directory, output_path, extensions=extensions or None)
+    except Exception as e:
+        return jsonify({"error": f"Failed to write snapshot: {str(e)}"}), 500
+
+    return jsonify({"directory": directory, "output": output, "total_files": count}), 201
+
+@file_bp.route('/diff', methods=['POST'])
+def diff_sorted_snapshots():
+    """Stream the changes between two sorted snapshots as NDJSON, ending with a summary line."""
+    data = request.json or {}
+    old_name = data.get('old')
+    new_name = data.get('new')
+
+    if not old_name or not new_name:
+        return jsonify({"error": "old and new snapshot names are required"}), 400
+
+    old_path, new_path = snapshot_path(old_name), snapshot_path(new_name)
+    for name, path in ((old_name, old_path), (new_name, new_path)):
+        if path is None:
+            return jsonify({"error": f"Invalid snapshot name: {name}"}), 400
+        if not os.path.isfile(path):
+            return jsonify({"error": f"Snapshot does not exist: {name}"}), 400
+
+    # Read the headers up front so a bad snapshot is a 400 rather than a broken stream
+    try:
+        changes = diff_snapshots(old_path, new_path, directories=data.get('directories', True))
+        first = next(changes, None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def stream():
+        summary = {"type": "summary", "added": 0, "removed": 0, "grown": 0, "shrunk": 0, "bytes_delta": 0}
+        for change in chain([first] if first is not None else [], changes):
+            if change["type"] != "directory":
+                summary[change["type"]] += 1
+                summary["bytes_delta"] += (change["new_size"] or 0) - (change["old_size"] or 0)
+            yield json.dumps(change) + "\n"
+        yield json.dumps(summary) + "\n"
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+# Helper Function: Parse Worker Count
+def parse_workers(value):
+    """Walker thread count from a request, clamped to 1..MAX_WORKERS; None if it is not an integer."""
+    try:
+        return min(max(int(value), 1), MAX_WORKERS)
+    except (TypeError, ValueError):
+        return None
+
+# Helper Function: Resolve Snapshot Name
+def snapshot_path(name):
+    """Path of a sorted snapshot under SNAPSHOT_DIR, or None for anything but a plain file name."""
+    if not isinstance(name, str) or name in ('.', '..') or '\0' in name \
+            or os.sep in name or (os.altsep and os.altsep in name):
+        return None
+    return os.path.join(SNAPSHOT_DIR, name)
+
+# Helper Function: Parse Timestamp
+def parse_timestamp(value):
+    """Epoch seconds from a number or an ISO 8601 date/time; None stays None."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time: {value}. Expected epoch seconds or an ISO 8601 date.")
+
+# Route: Disk Growth Trends
+@file_bp.route('/trends', methods=['GET'])
+def get_trends():
+    """Recorded file counts and bytes of a directory over time, from pre-aggregated buckets."""
+    directory = request.args.get('directory')
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    resolution = request.args.get('resolution')
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+
+    try:
+        start = parse_timestamp(request.args.get('start'))
+        end = parse_timestamp(request.args.get('end'))
+        with TrendStore(TRENDS_PATH) as store:
+            trends = store.query(directory, kind=request.args.get('kind', 'total'),
+                                 names=request.args.getlist('name') or None,
+                                 start=start, end=end, resolution=resolution)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(trends), 200
+
+# Route: Live Inventory
+@file_bp.route('/watch', methods=['POST'])
+def watch_directory():
+    """Start keeping a live inventory of a directory tree."""
+    data = request.json or {}
+    directory = data.get('directory')
+
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory does not exist or is not accessible"}), 400
+
+    try:
+        max_watches = int(data.get('max_watches', 8192))
+        rescan_interval = float(data.get('rescan_interval', 300))
+        trend_interval = float(data.get('trend_interval', 300))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_watches, rescan_interval and trend_interval must be numbers"}), 400
+    if max_watches < 0 or not rescan_interval > 0 or not trend_interval > 0:
+        return jsonify({"error": "max_watches must not be negative and the intervals must be positive"}), 400
+
+    watcher = start_watcher(
+        directory,
+        max_watches=max_watches,
+        rescan_interval=rescan_interval,
+        index_path=SCAN_INDEX_PATH,
+        trends_path=TRENDS_PATH if data.get('record_trends', True) else None,
+        trend_interval=trend_interval,
+    )
+    return jsonify({"message": f"Watching {watcher.root}", "directory": watcher.root}), 202
+
+@file_bp.route('/watch', methods=['DELETE'])
+def unwatch_directory():
+    """Stop the live inventory of a directory tree."""
+    directory = (request.json or {}).get('directory') or request.args.get('directory')
+    if not directory or stop_watcher(directory) is None:
+        return jsonify({"error": "Directory is not being watched"}), 404
+    return jsonify({"message": f"Stopped watching {directory}"}), 200
+
+@file_bp.route('/inventory', methods=['GET'])
+def get_inventory():
+    """List files of a watched directory straight from its live inventory."""
+    directory = request.args.get('directory')
+    if not directory:
+        return jsonify({"error": "Directory is required"}), 400
+
+    watcher = find_watcher(directory)
+    if watcher is None:
+        return jsonify({"error": "Directory is not being watched or is still loading"}), 404
+
+    extensions = [ext.lower() for ext in request.args.getlist('extensions')]
+    accept = compile_name_filter(
+        extensions=extensions or None,
+        include=request.args.getlist('include') or None,
+        exclude=request.args.getlist('exclude') or None,
+    )
+    time_format = request.args.get('time_format', 'default')
+    if time_format not in TIME_FORMATS:
+        return jsonify({"error": f"Unsupported time format: {time_format}"}), 400
+
+    files = [
+        record.to_dict(time_format) for record in watcher.inventory.records(directory)
+        if accept is None or accept(os.path.basename(record.file_path))
+    ]
+    return jsonify({
+        "directory": os.path.abspath(directory),
+        "files": files,
+        "total": len(files),
+        "degraded": watcher.degraded,
+        "watches": watcher.watch_count,
+    }), 200
+
 @file_bp.route('/parse-finance', methods=['POST'])
 def parse_finance_file():
     file = request.files.get('file')
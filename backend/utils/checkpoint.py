@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import time
+
+from backend.utils.scan_index import EXTRA_STAT_FIELDS, STAT_FIELDS
+
+# Bump when the state or results layout changes; other checkpoints are discarded.
+CHECKPOINT_VERSION = 1
+# Seconds between saves; a crash loses at most this much of the walk
+CHECKPOINT_INTERVAL = 5.0
+# Checkpoints not saved for this long are treated as abandoned and removed rather than resumed
+CHECKPOINT_MAX_AGE = 7 * 86400
+
+def checkpoint_path(directory, checkpoint_dir, options=None):
+    """Checkpoint file for one scan, so resubmitting the same scan finds it again."""
+    key = json.dumps([os.path.abspath(directory), options or {}], sort_keys=True, default=str)
+    return os.path.join(checkpoint_dir, hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest() + ".json")
+
+def discard_checkpoint(path):
+    """Remove a checkpoint's state and results files, whatever state they are in."""
+    for file_path in (path, f"{path}.results", f"{path}.tmp"):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+class ScanCheckpoint:
+    """Walk frontier and partial results of a long scan, saved to disk so it can resume.
+
+    path holds the state: scan root and options, the stack of directories
+    still to be listed, and how much of the results file belonged to the
+    directories already done. Matching files and per-entry errors are
+    appended to path + ".results", one JSON row each, with the full stat
+    tuple so a resumed scan can replay them as they were found. Opening a
+    checkpoint whose state matches root and options resumes it: the results
+    file is cut back to the saved length, since the directories being
+    walked at the time of the crash are still on the saved stack and will
+    be listed again. Anything else starts over.
+    """
+
+    def __init__(self, path, root, options=None, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.root = os.path.abspath(root)
+        self.options = options or {}
+        self.interval = interval
+        self.results_path = f"{path}.results"
+        self.pending = None
+        self.saved_at = None
+        self._next_save = time.monotonic() + interval
+
+        state = self._load()
+        if state is not None:
+            self.pending = state["pending"]
+            self.saved_at = state["saved_at"]
+            results_size = state["results_size"]
+        else:
+            results_size = 0
+        if os.path.exists(self.results_path) or results_size:
+            os.truncate(self.results_path, results_size)
+        self._results = open(self.results_path, "ab")
+
+    @property
+    def resumed(self):
+        return self.pending is not None
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        same_scan = (
+            state.get("version") == CHECKPOINT_VERSION and state.get("root") == self.root
+            and json.dumps(state.get("options"), sort_keys=True, default=str)
+            == json.dumps(self.options, sort_keys=True, default=str)
+        )
+        if not same_scan or not os.path.exists(self.results_path) \
+                or os.path.getsize(self.results_path) < state["results_size"]:
+            return None
+        return state
+
+    @staticmethod
+    def read_state(path):
+        """The saved state of a checkpoint file, or None if there is no usable one."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state if state.get("version") == CHECKPOINT_VERSION else None
+
+    @staticmethod
+    def read_resumable(path, max_age=CHECKPOINT_MAX_AGE):
+        """Like read_state, but None unless the scan can really be resumed from it.
+
+        The state must be complete, saved within max_age seconds, and its
+        results file must still hold everything the state points into.
+        """
+        state = ScanCheckpoint.read_state(path)
+        if state is None or any(key not in state for key in ("root", "options", "pending", "results_size")):
+            return None
+        if time.time() - state.get("saved_at", 0) > max_age:
+            return None
+        try:
+            if os.path.getsize(f"{path}.results") < state["results_size"]:
+                return None
+        except OSError:
+            return None
+        return state
+
+    def replay(self):
+        """Yield ("file", path, stat) and ("error", record) rows saved by the interrupted run, in order."""
+        if not self.resumed:
+            return
+        fields = STAT_FIELDS + EXTRA_STAT_FIELDS
+        with open(self.results_path, "rb") as f:
+            for line in f:
+                row = json.loads(line)
+                if row[0] == "e":
+                    yield "error", row[1]
+                else:
+                    stat = row[2:]
+                    yield "file", row[1], os.stat_result(
+                        stat[:len(STAT_FIELDS)], dict(zip(EXTRA_STAT_FIELDS, stat[len(STAT_FIELDS):len(fields)]))
+                    )
+
+    def add_file(self, file_path, stat):
+        row = ["f", file_path, *(getattr(stat, field, 0) for field in STAT_FIELDS + EXTRA_STAT_FIELDS)]
+        self._results.write(json.dumps(row).encode() + b"\n")
+
+    def add_error(self, record):
+        self._results.write(json.dumps(["e", record]).encode() + b"\n")
+
+    def walked(self, stack):
+        """Called by the walker between directories with the stack of those still to list."""
+        if time.monotonic() >= self._next_save:
+            self.save(stack)
+
+    def save(self, stack):
+        """Write the state durably: results first, then the state that points into them."""
+        self._results.flush()
+        os.fsync(self._results.fileno())
+        self.saved_at = time.time()
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "root": self.root,
+            "options": self.options,
+            "pending": list(stack),
+            "results_size": self._results.tell(),
+            "saved_at": self.saved_at,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._next_save = time.monotonic() + self.interval
+
+    def close(self):
+        """Stop writing; the last saved state stays on disk for a later resume."""
+        if not self._results.closed:
+            self._results.close()
+
+    def discard(self):
+        """Stop writing and remove the checkpoint, e.g. for a cancelled scan that must not come back."""
+        self.close()
+        discard_checkpoint(self.path)
+
+    def complete(self):
+        """The scan finished: nothing is left to resume, so remove both files."""
+        self.discard()
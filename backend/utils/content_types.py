@@ -0,0 +1,201 @@
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.utils.file_scanner import _scan_entries
+
+# Bytes read from the start of a file to identify it
+READ_SIZE = 4096
+# Files looked up in the index and sniffed together
+BATCH_SIZE = 1024
+UNKNOWN = ("application/octet-stream", "")
+
+# (offset, magic bytes, MIME type, usual extension), checked in order
+SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (0, b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (0, b"GIF87a", "image/gif", ".gif"),
+    (0, b"GIF89a", "image/gif", ".gif"),
+    (0, b"BM", "image/bmp", ".bmp"),
+    (0, b"II*\x00", "image/tiff", ".tif"),
+    (0, b"MM\x00*", "image/tiff", ".tif"),
+    (0, b"\x00\x00\x01\x00", "image/vnd.microsoft.icon", ".ico"),
+    (0, b"%PDF-", "application/pdf", ".pdf"),
+    (0, b"\x1f\x8b", "application/gzip", ".gz"),
+    (0, b"BZh", "application/x-bzip2", ".bz2"),
+    (0, b"\xfd7zXZ\x00", "application/x-xz", ".xz"),
+    (0, b"(\xb5/\xfd", "application/zstd", ".zst"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed", ".7z"),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar", ".rar"),
+    (257, b"ustar", "application/x-tar", ".tar"),
+    (0, b"\x7fELF", "application/x-executable", ""),
+    (0, b"MZ", "application/vnd.microsoft.portable-executable", ".exe"),
+    (0, b"\xca\xfe\xba\xbe", "application/java-vm", ".class"),
+    (0, b"\xcf\xfa\xed\xfe", "application/x-mach-binary", ""),
+    (0, b"\x00asm", "application/wasm", ".wasm"),
+    (0, b"SQLite format 3\x00", "application/vnd.sqlite3", ".sqlite"),
+    (0, b"ID3", "audio/mpeg", ".mp3"),
+    (0, b"\xff\xfb", "audio/mpeg", ".mp3"),
+    (0, b"fLaC", "audio/flac", ".flac"),
+    (0, b"OggS", "audio/ogg", ".ogg"),
+    (0, b"\x1aE\xdf\xa3", "video/x-matroska", ".mkv"),
+    (0, b"wOFF", "font/woff", ".woff"),
+    (0, b"wOF2", "font/woff2", ".woff2"),
+    (0, b"\x00\x01\x00\x00\x00", "font/ttf", ".ttf"),
+    (0, b"OTTO", "font/otf", ".otf"),
+)
+RIFF_TYPES = {b"WEBP": ("image/webp", ".webp"), b"WAVE": ("audio/wav", ".wav"), b"AVI ": ("video/x-msvideo", ".avi")}
+FTYP_BRANDS = {
+    b"heic": ("image/heic", ".heic"), b"heix": ("image/heic", ".heic"), b"mif1": ("image/heif", ".heif"),
+    b"avif": ("image/avif", ".avif"), b"qt  ": ("video/quicktime", ".mov"), b"M4A ": ("audio/mp4", ".m4a"),
+}
+# Names near the start of a ZIP archive that give away what it really is
+ZIP_MARKERS = (
+    (b"AndroidManifest.xml", ("application/vnd.android.package-archive", ".apk")),
+    (b"classes.dex", ("application/vnd.android.package-archive", ".apk")),
+    (b"word/", ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx")),
+    (b"xl/", ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx")),
+    (b"ppt/", ("application/vnd.openxmlformats-officedocument.presentationml.presentation", ".pptx")),
+    (b"META-INF/MANIFEST.MF", ("application/java-archive", ".jar")),
+)
+TEXT_PREFIXES = (
+    (b"BEGIN:VCALENDAR", ("text/calendar", ".ics")),
+    (b"<?xml", ("application/xml", ".xml")),
+    (b"<!doctype html", ("text/html", ".html")),
+    (b"<html", ("text/html", ".html")),
+    (b"<svg", ("image/svg+xml", ".svg")),
+    (b"{", ("application/json", ".json")),
+    (b"[", ("application/json", ".json")),
+    (b"#!", ("text/x-script", "")),
+)
+# Text types are guesses from the first bytes, so they never flag an extension as wrong
+GUESSED_TYPES = {detected for _, detected in TEXT_PREFIXES} | {("text/plain", ".txt")}
+# Extensions interchangeable with the usual one returned by identify()
+EQUIVALENT_EXTENSIONS = {
+    ".jpg": {".jpeg", ".jpe", ".jfif"},
+    ".tif": {".tiff"},
+    ".gz": {".tgz"},
+    ".mp4": {".m4v"},
+    ".sqlite": {".db", ".sqlite3"},
+    ".exe": {".dll", ".sys"},
+    ".zip": {".whl", ".egg", ".nupkg"},
+}
+
+def _zip_type(head):
+    # An uncompressed "mimetype" first entry (EPUB, OpenDocument) names the type outright
+    if head[30:38] == b"mimetype":
+        name_length, extra_length = struct.unpack_from("<HH", head, 26)
+        start = 30 + name_length + extra_length
+        mimetype = head[start:start + 80].split(b"PK", 1)[0].decode("ascii", "replace").strip()
+        if mimetype:
+            return mimetype, {"application/epub+zip": ".epub"}.get(mimetype, ".zip")
+    for marker, detected in ZIP_MARKERS:
+        if marker in head:
+            return detected
+    return "application/zip", ".zip"
+
+def _text_type(head):
+    if b"\x00" in head:
+        return None
+    try:
+        # A multi-byte character cut off at the end of the buffer is fine
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:
+            return None
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n")[:16].lower()
+    for prefix, detected in TEXT_PREFIXES:
+        if start.startswith(prefix.lower()):
+            return detected
+    return "text/plain", ".txt"
+
+def identify(head):
+    """(MIME type, usual extension) of a file from its first bytes; UNKNOWN if nothing matches."""
+    if not head:
+        return "application/x-empty", ""
+    if head.startswith(b"PK\x03\x04") or head.startswith(b"PK\x05\x06"):
+        return _zip_type(head)
+    if head.startswith(b"RIFF") and head[8:12] in RIFF_TYPES:
+        return RIFF_TYPES[head[8:12]]
+    if head[4:8] == b"ftyp":
+        return FTYP_BRANDS.get(head[8:12], ("video/mp4", ".mp4"))
+    for offset, magic, mime, extension in SIGNATURES:
+        if head.startswith(magic, offset):
+            return mime, extension
+    return _text_type(head) or UNKNOWN
+
+def sniff(file_path, read_size=READ_SIZE):
+    """Identify one file by reading at most read_size bytes from its start; None if it cannot be read."""
+    try:
+        # O_NONBLOCK so a FIFO met by the walk cannot hang the worker
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_NONBLOCK", 0))
+    except OSError:
+        return None
+    try:
+        return identify(os.pread(fd, read_size, 0))
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+def detect_content_types(entries, workers=8, index=None, read_size=READ_SIZE):
+    """Yield (file path, stat, (MIME type, extension)) for (file path, stat) pairs.
+
+    Files are read on a thread pool, a batch at a time. With a ScanIndex,
+    results are cached per inode and reused while the file's mtime and size
+    are unchanged, so repeated scans only read new or modified files.
+    Unreadable files get a None type.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch = []
+        for item in entries:
+            batch.append(item)
+            if len(batch) >= BATCH_SIZE:
+                yield from _detect_batch(batch, pool, index, read_size)
+                batch = []
+        if batch:
+            yield from _detect_batch(batch, pool, index, read_size)
+
+def _detect_batch(batch, pool, index, read_size):
+    cached = index.cached_content_types(stat for _, stat in batch) if index is not None else {}
+    missing = [(file_path, stat) for file_path, stat in batch if (stat.st_dev, stat.st_ino) not in cached]
+    detected = dict(zip(
+        (file_path for file_path, _ in missing),
+        pool.map(lambda file_path: sniff(file_path, read_size), (file_path for file_path, _ in missing)),
+    ))
+    if index is not None:
+        index.store_content_types(
+            (stat, detected[file_path]) for file_path, stat in missing if detected[file_path] is not None
+        )
+    for file_path, stat in batch:
+        content_type = cached.get((stat.st_dev, stat.st_ino))
+        yield file_path, stat, content_type if content_type is not None else detected[file_path]
+
+def content_type_summary(path, workers=8, index=None, examples=5, **scan_options):
+    """Scan path and group its files by detected type.
+
+    Returns {"types": {mime: {count, total_size, extensions}}, "mismatched":
+    {"count", "examples"}}, where mismatched files are binary formats whose
+    extension is not the one their content suggests (including none at all).
+    The walk always stats files afresh; index only caches sniffed types,
+    since its listings keep the old size and mtime of a file rewritten in
+    place and would hand it a stale type.
+    """
+    types = {}
+    mismatched = {"count": 0, "examples": []}
+    for file_path, stat, content_type in detect_content_types(
+        _scan_entries(path, **scan_options), workers, index
+    ):
+        content_type = content_type or UNKNOWN
+        mime, expected = content_type
+        extension = os.path.splitext(file_path)[1].lower()
+        summary = types.setdefault(mime, {"count": 0, "total_size": 0, "extensions": {}})
+        summary["count"] += 1
+        summary["total_size"] += stat.st_size
+        summary["extensions"][extension] = summary["extensions"].get(extension, 0) + 1
+        if (expected and content_type not in GUESSED_TYPES and extension != expected
+                and extension not in EQUIVALENT_EXTENSIONS.get(expected, ())):
+            mismatched["count"] += 1
+            if len(mismatched["examples"]) < examples:
+                mismatched["examples"].append({"file_path": file_path, "content_type": mime, "expected": expected})
+    return {"types": types, "mismatched": mismatched}
@@ -0,0 +1,218 @@
+import heapq
+import json
+import os
+
+from backend.utils.file_scanner import iter_files
+from backend.utils.scan_filters import compile_name_filter
+
+# Default JSON budget for treemap responses, whatever the size of the tree
+TREEMAP_MAX_BYTES = 48 * 1024
+# Separators and the enclosing "children" list, per node
+TREEMAP_NODE_OVERHEAD = 16
+TREEMAP_OTHER = "(other)"
+
+def allocated_size(stat):
+    """Bytes a file occupies on disk; st_blocks counts 512-byte units whatever the filesystem block size."""
+    blocks = getattr(stat, "st_blocks", None)
+    return stat.st_size if blocks is None else blocks * 512
+
+class InodeSet:
+    """Compact visited set of (st_dev, st_ino) pairs for hardlink deduplication.
+
+    Only files with more than one link are remembered, since a file with a
+    single link cannot be reached twice; on most trees that is a tiny
+    minority. Inode numbers are kept as plain ints in one set per device
+    rather than as a tuple per file.
+    """
+
+    def __init__(self):
+        self._devices = {}
+        self.skipped = 0
+
+    def __len__(self):
+        return sum(len(inodes) for inodes in self._devices.values())
+
+    def first_visit(self, stat):
+        """Return True the first time an inode is seen, False for every further link to it."""
+        if stat.st_nlink < 2:
+            return True
+        inodes = self._devices.get(stat.st_dev)
+        if inodes is None:
+            inodes = self._devices[stat.st_dev] = set()
+        if stat.st_ino in inodes:
+            self.skipped += 1
+            return False
+        inodes.add(stat.st_ino)
+        return True
+
+class SizeTotals:
+    """Running file count with apparent and allocated byte totals.
+
+    With dedupe_hardlinks every link is still counted as a file, but its
+    bytes only once per inode, so the totals match real disk consumption.
+    """
+
+    def __init__(self, dedupe_hardlinks=True):
+        self.inodes = InodeSet() if dedupe_hardlinks else None
+        self.files = 0
+        self.apparent_bytes = 0
+        self.allocated_bytes = 0
+
+    def add(self, stat):
+        """Count one file and return the (apparent, allocated) bytes it contributed."""
+        self.files += 1
+        if self.inodes is not None and not self.inodes.first_visit(stat):
+            return 0, 0
+        apparent, allocated = stat.st_size, allocated_size(stat)
+        self.apparent_bytes += apparent
+        self.allocated_bytes += allocated
+        return apparent, allocated
+
+    def to_dict(self):
+        return {
+            "files": self.files,
+            "apparent_bytes": self.apparent_bytes,
+            "allocated_bytes": self.allocated_bytes,
+            "hardlinks_skipped": self.inodes.skipped if self.inodes is not None else 0,
+        }
+
+class DiskUsage:
+    """Recursive byte totals and file counts for every directory of a scan.
+
+    totals maps each directory to [bytes, files, allocated bytes] for
+    everything below it and children maps each directory to its
+    subdirectories that hold files.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.totals = {root: [0, 0, 0]}
+        self.children = {root: []}
+        self.hardlinks_skipped = 0
+
+    def _add_directory(self, directory):
+        # Register missing ancestors first so insertion order stays parent-before-child
+        missing = []
+        while directory not in self.totals:
+            missing.append(directory)
+            directory = os.path.dirname(directory)
+        for path in reversed(missing):
+            self.totals[path] = [0, 0, 0]
+            self.children[path] = []
+            self.children[os.path.dirname(path)].append(path)
+
+    def add_file(self, directory, size, allocated=None):
+        if directory not in self.totals:
+            self._add_directory(directory)
+        totals = self.totals[directory]
+        totals[0] += size
+        totals[1] += 1
+        totals[2] += size if allocated is None else allocated
+
+    def roll_up(self):
+        """Fold every directory's totals into its parent in a single post-order pass."""
+        for directory in reversed(list(self.totals)):
+            if directory != self.root:
+                parent = self.totals[os.path.dirname(directory)]
+                for i, value in enumerate(self.totals[directory]):
+                    parent[i] += value
+        return self
+
+    def tree(self, path=None, depth=2, top=10):
+        """Nested {path, size, allocated, files, children} view with at most top children per node."""
+        path = self.root if path is None else path.rstrip(os.sep) or os.sep
+        if path not in self.totals:
+            return None
+        size, files, allocated = self.totals[path]
+        node = {"path": path, "size": size, "allocated": allocated, "files": files}
+        if depth > 0:
+            largest = sorted(self.children[path], key=lambda child: self.totals[child][0], reverse=True)
+            node["children"] = [self.tree(child, depth - 1, top) for child in largest[:top]]
+        return node
+
+    def treemap(self, path=None, depth=4, top=12, max_bytes=TREEMAP_MAX_BYTES):
+        """Level-of-detail tree for treemap rendering, bounded to about max_bytes of JSON.
+
+        Nodes are expanded largest first; each shows its top largest
+        subdirectories and one synthetic "other" child covering the rest,
+        including files directly inside it, so children always sum to their
+        parent. Children carry only their name; drill down by requesting
+        path joined with that name.
+        """
+        path = self.root if path is None else path.rstrip(os.sep) or os.sep
+        if path not in self.totals:
+            return None
+        size, files, allocated = self.totals[path]
+        root = {"path": path, "size": size, "allocated": allocated, "files": files}
+        budget = max_bytes - len(json.dumps(root))
+        # Max-heap of nodes waiting to be expanded, biggest first so the budget goes where the space is
+        pending = [(-size, 0, path, root, 0)]
+        order = 1
+        while pending and budget > 0:
+            _, _, directory, node, level = heapq.heappop(pending)
+            largest = heapq.nlargest(top, self.children[directory], key=lambda child: self.totals[child][0])
+            node["children"] = children = []
+            shown_size = shown_files = shown_allocated = 0
+            for child in largest:
+                child_size, child_files, child_allocated = self.totals[child]
+                child_node = {
+                    "name": os.path.basename(child), "size": child_size,
+                    "allocated": child_allocated, "files": child_files,
+                }
+                cost = len(json.dumps(child_node)) + TREEMAP_NODE_OVERHEAD
+                if cost > budget:
+                    break
+                budget -= cost
+                children.append(child_node)
+                shown_size += child_size
+                shown_files += child_files
+                shown_allocated += child_allocated
+                if level + 1 < depth and self.children[child]:
+                    heapq.heappush(pending, (-child_size, order, child, child_node, level + 1))
+                    order += 1
+            other = {
+                "name": TREEMAP_OTHER,
+                "size": node["size"] - shown_size,
+                "allocated": node["allocated"] - shown_allocated,
+                "files": node["files"] - shown_files,
+                "directories": len(self.children[directory]) - len(children),
+                "other": True,
+            }
+            if other["size"] or other["files"] or other["directories"]:
+                children.append(other)
+                budget -= len(json.dumps(other)) + TREEMAP_NODE_OVERHEAD
+        return root
+
+def _walk_entries(root, accept, workers, index, follow_symlinks, one_filesystem, per_mount):
+    for entry in iter_files(root, accept=accept, workers=workers, ordered=False, index=index,
+                            follow_symlinks=follow_symlinks, one_filesystem=one_filesystem, per_mount=per_mount):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        yield entry.path, stat
+
+def directory_usage(path, workers=1, index=None, exclude_hidden=True, exclude_pyc=True, exclude_init=True,
+                    extensions=None, dedupe_hardlinks=False, follow_symlinks=False, one_filesystem=False,
+                    per_mount=False, entries=None):
+    """Walk path once and return its DiskUsage with recursive totals computed.
+
+    Sizes are apparent sizes with allocated bytes alongside. With
+    dedupe_hardlinks the bytes of a hardlinked file are only counted under
+    the first of its links that the walk reaches, as du does.
+    follow_symlinks, one_filesystem and per_mount are as for iter_files.
+
+    entries, (file path, stat) pairs under path such as those of
+    InventoryWatcher.entries, are totalled instead of walking path; the
+    name filters are then up to whoever produced them.
+    """
+    root = path.rstrip(os.sep) or os.sep
+    usage = DiskUsage(root)
+    totals = SizeTotals(dedupe_hardlinks)
+    if entries is None:
+        entries = _walk_entries(root, compile_name_filter(exclude_hidden, exclude_pyc, exclude_init, extensions),
+                                workers, index, follow_symlinks, one_filesystem, per_mount)
+    for file_path, stat in entries:
+        usage.add_file(os.path.dirname(file_path), *totals.add(stat))
+    usage.hardlinks_skipped = totals.to_dict()["hardlinks_skipped"]
+    return usage.roll_up()
@@ -0,0 +1,151 @@
+import functools
+import hashlib
+import mmap
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from backend.utils.file_scanner import _scan_entries
+
+# Bytes read from each end of a file for the partial hash
+PARTIAL_SIZE = 4096
+# Bytes hashed per rate-limit step when a throttle is in use
+THROTTLED_CHUNK = 1024 * 1024
+# Start method for the full-hash processes, never plain fork
+_HASH_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+def _partial_hash(args, throttle=None):
+    """Hash the first and last partial_size bytes of a file."""
+    file_path, file_size, partial_size = args
+    try:
+        if throttle is not None:
+            throttle.consume_bytes(min(file_size, 2 * partial_size))
+        with open(file_path, 'rb') as f:
+            digest = hashlib.blake2b(f.read(partial_size))
+            if file_size > partial_size:
+                f.seek(max(file_size - partial_size, partial_size))
+                digest.update(f.read(partial_size))
+        return file_path, digest.hexdigest()
+    except OSError:
+        return file_path, None
+
+def _full_hash(file_path):
+    """Hash a whole file through mmap so the data is never copied into Python."""
+    try:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return file_path, hashlib.blake2b(data).hexdigest()
+    except (OSError, ValueError):
+        return file_path, None
+
+def _throttled_full_hash(file_path, throttle):
+    """Hash a whole file chunk by chunk, paying the throttle for each chunk before reading it."""
+    try:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            digest = hashlib.blake2b()
+            for start in range(0, len(data), THROTTLED_CHUNK):
+                throttle.consume_bytes(min(THROTTLED_CHUNK, len(data) - start))
+                digest.update(data[start:start + THROTTLED_CHUNK])
+            return file_path, digest.hexdigest()
+    except (OSError, ValueError):
+        return file_path, None
+
+def _group_by_digest(keyed_results):
+    """Group ((key, file_path), digest) results and keep groups with more than one file."""
+    groups = defaultdict(list)
+    for (key, file_path), digest in keyed_results:
+        if digest is not None:
+            groups[(key, digest)].append(file_path)
+    return {key: paths for key, paths in groups.items() if len(paths) > 1}
+
+def find_duplicates(records, partial_size=PARTIAL_SIZE, workers=None, throttle=None):
+    """Yield groups of identical files from scan_directory style records.
+
+    Files are bucketed by size, same-size files are compared by a hash of
+    their first and last partial_size bytes, and only files that still
+    collide are hashed in full on a process pool. Each group is a dict with
+    file_size, hash, files and wasted_bytes. With a ScanThrottle the bytes
+    read are rate limited and full hashes run on threads that share it.
+
+    Records may carry an inode key, (st_dev, st_ino); further hard links
+    to an inode already seen are dropped before bucketing, since they
+    share its data and waste no space.
+    """
+    by_size = defaultdict(list)
+    inodes = set()
+    for record in records:
+        inode = record.get("inode")
+        if inode is not None:
+            if inode in inodes:
+                continue
+            inodes.add(inode)
+        if record["file_size"] > 0:
+            by_size[record["file_size"]].append(record["file_path"])
+    candidates = [(size, path) for size, paths in by_size.items() if len(paths) > 1 for path in paths]
+    if not candidates:
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as threads:
+        partial_results = threads.map(
+            functools.partial(_partial_hash, throttle=throttle), [(path, size, partial_size) for size, path in candidates]
+        )
+        partial = _group_by_digest(
+            ((size, path), digest) for (size, _), (path, digest) in zip(candidates, partial_results)
+        )
+
+    # Small files were read completely by the partial hash
+    needs_full_hash = []
+    for (file_size, digest), files in partial.items():
+        if file_size <= 2 * partial_size:
+            yield _duplicate_group(file_size, digest, files)
+        else:
+            needs_full_hash.extend((file_size, path) for path in files)
+
+    if needs_full_hash:
+        # A throttle cannot be shared with other processes, so throttled hashing stays on threads
+        if throttle is not None:
+            pool = ThreadPoolExecutor(max_workers=workers)
+            hash_file = functools.partial(_throttled_full_hash, throttle=throttle)
+        else:
+            # Forking the threaded API server can copy a lock some other thread holds; forkserver children start clean
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=_HASH_CONTEXT)
+            hash_file = _full_hash
+        with pool:
+            full_results = pool.map(hash_file, [path for _, path in needs_full_hash], chunksize=16)
+            full = _group_by_digest(
+                ((size, path), digest) for (size, _), (path, digest) in zip(needs_full_hash, full_results)
+            )
+        for (file_size, digest), files in full.items():
+            yield _duplicate_group(file_size, digest, files)
+
+def _duplicate_group(file_size, digest, files):
+    return {
+        "file_size": file_size,
+        "hash": digest,
+        "files": sorted(files),
+        "wasted_bytes": file_size * (len(files) - 1),
+    }
+
+def find_duplicate_files(path, workers=None, throttle=None, entries=None, **scan_options):
+    """Scan path and yield its duplicate file groups, counting hard links to one file once.
+
+    entries, (file path, stat) pairs such as those of
+    InventoryWatcher.entries, are used instead of scanning path.
+    """
+    if entries is None:
+        entries = _scan_entries(path, throttle=throttle, **scan_options)
+    records = (
+        {
+            "file_path": file_path,
+            "file_size": stat.st_size,
+            # Only multiply linked files can turn up twice
+            "inode": (stat.st_dev, stat.st_ino) if stat.st_nlink > 1 else None,
+        }
+        for file_path, stat in entries
+    )
+    try:
+        yield from find_duplicates(records, workers=workers, throttle=throttle)
+    finally:
+        if throttle is not None:
+            throttle.restore()
@@ -0,0 +1,170 @@
+import math
+import os
+import random
+import time
+from collections import OrderedDict
+from statistics import NormalDist
+
+from backend.utils.file_scanner import _list_dir
+from backend.utils.scan_filters import compile_name_filter
+
+# Directory summaries kept between probes, least recently used dropped first
+MAX_CACHED_DIRECTORIES = 100_000
+# Longest sampling budget iter_estimates accepts, so one request cannot hold a worker indefinitely
+MAX_ESTIMATE_SECONDS = 300
+
+class _Moments:
+    """Running sum and sum of squares of one quantity over all probes."""
+
+    __slots__ = ("total", "squares")
+
+    def __init__(self):
+        self.total = 0.0
+        self.squares = 0.0
+
+    def add(self, value):
+        self.total += value
+        self.squares += value * value
+
+    def interval(self, probes, z):
+        """(estimate, low, high) for the mean over probes; a probe that never saw the quantity counts as zero."""
+        mean = self.total / probes
+        if probes < 2:
+            return round(mean), 0, None
+        variance = max(self.squares - self.total * self.total / probes, 0.0) / (probes - 1)
+        margin = z * math.sqrt(variance / probes)
+        return round(mean), max(round(mean - margin), 0), round(mean + margin)
+
+class UsageEstimator:
+    """Approximate file counts and bytes per extension under a tree from random probes.
+
+    Each probe walks from the root down to a leaf directory, picking a random
+    subdirectory at every level. The files of each directory on that path,
+    weighted by the product of the branching factors above it, are an
+    unbiased estimate of the whole tree's totals (Knuth's tree-size
+    estimator); averaging probes narrows it, and the spread between probes
+    gives normal confidence intervals. Listings are cached, so directories
+    near the root that most probes pass through are only read once. The same
+    seed replays the same probes.
+    """
+
+    def __init__(self, path, seed=None, accept=None, exclude_dirs=('venv',)):
+        self.path = path
+        self.seed = seed
+        self.accept = accept
+        self.exclude_dirs = exclude_dirs
+        self.probes = 0
+        self.directories_listed = 0
+        self.started_at = time.time()
+        self._random = random.Random(seed)
+        self._cache = OrderedDict()
+        self._files = _Moments()
+        self._bytes = _Moments()
+        self._extensions = {}
+
+    def _summary(self, directory):
+        """({extension: [files, bytes]}, sorted subdirectories) of one directory, cached."""
+        summary = self._cache.get(directory)
+        if summary is not None:
+            self._cache.move_to_end(directory)
+            return summary
+        files, subdirs = _list_dir(directory, self.accept, self.exclude_dirs, prefetch_stat=True)
+        by_extension = {}
+        for entry in files:
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            totals = by_extension.setdefault(os.path.splitext(entry.name)[1].lower(), [0, 0])
+            totals[0] += 1
+            totals[1] += size
+        summary = self._cache[directory] = (by_extension, sorted(subdirs))
+        self.directories_listed += 1
+        if len(self._cache) > MAX_CACHED_DIRECTORIES:
+            self._cache.popitem(last=False)
+        return summary
+
+    def probe(self):
+        """Walk one random root-to-leaf path and fold its estimate into the running totals."""
+        estimate = {}
+        weight = 1
+        directory = self.path
+        while True:
+            by_extension, subdirs = self._summary(directory)
+            for extension, (files, size) in by_extension.items():
+                totals = estimate.setdefault(extension, [0, 0])
+                totals[0] += weight * files
+                totals[1] += weight * size
+            if not subdirs:
+                break
+            weight *= len(subdirs)
+            directory = self._random.choice(subdirs)
+
+        self.probes += 1
+        self._files.add(sum(files for files, _ in estimate.values()))
+        self._bytes.add(sum(size for _, size in estimate.values()))
+        for extension, (files, size) in estimate.items():
+            moments = self._extensions.get(extension)
+            if moments is None:
+                moments = self._extensions[extension] = (_Moments(), _Moments())
+            moments[0].add(files)
+            moments[1].add(size)
+
+    def run(self, seconds=None, probes=None):
+        """Probe until seconds have passed or probes more probes are done, whichever comes first."""
+        deadline = time.monotonic() + seconds if seconds is not None else None
+        target = self.probes + probes if probes is not None else None
+        while (target is None or self.probes < target) and (deadline is None or time.monotonic() < deadline):
+            self.probe()
+        return self
+
+    def estimate(self, confidence=0.95, top=20):
+        """Current estimate with confidence intervals, listing the top extensions by estimated bytes."""
+        if not self.probes:
+            self.probe()
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+        def interval(moments):
+            value, low, high = moments.interval(self.probes, z)
+            return {"estimate": value, "low": low, "high": high}
+
+        largest = sorted(self._extensions.items(), key=lambda item: item[1][1].total, reverse=True)[:top]
+        return {
+            "directory": self.path,
+            "seed": self.seed,
+            "probes": self.probes,
+            "directories_listed": self.directories_listed,
+            "elapsed_seconds": round(time.time() - self.started_at, 3),
+            "confidence": confidence,
+            "files": interval(self._files),
+            "bytes": interval(self._bytes),
+            "extensions": {
+                extension: {"files": interval(files), "bytes": interval(size)}
+                for extension, (files, size) in largest
+            },
+        }
+
+def iter_estimates(path, seconds=5, interval=0.5, seed=None, confidence=0.95, top=20, exclude_hidden=True,
+                   exclude_pyc=True, exclude_init=True, extensions=None):
+    """Yield a refined estimate of path every interval seconds until seconds have passed."""
+    if not interval > 0:
+        raise ValueError("interval must be positive")
+    if not 0 <= seconds <= MAX_ESTIMATE_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_ESTIMATE_SECONDS}")
+    accept = compile_name_filter(exclude_hidden, exclude_pyc, exclude_init, extensions)
+    estimator = UsageEstimator(path, seed, accept)
+    deadline = time.monotonic() + seconds
+    while True:
+        remaining = deadline - time.monotonic()
+        estimator.run(seconds=max(min(interval, remaining), 0))
+        final = remaining <= interval
+        yield {**estimator.estimate(confidence, top), "final": final}
+        if final:
+            return
+
+def estimate_usage(path, seconds=5, probes=None, seed=None, confidence=0.95, top=20, exclude_hidden=True,
+                   exclude_pyc=True, exclude_init=True, extensions=None):
+    """Estimate per-extension file counts and bytes under path within a time or probe budget."""
+    accept = compile_name_filter(exclude_hidden, exclude_pyc, exclude_init, extensions)
+    estimator = UsageEstimator(path, seed, accept)
+    return estimator.run(seconds, probes).estimate(confidence, top)
@@ -1,61 +1,486 @@
+import heapq
 import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 import humanize
+from backend.utils.scan_filters import compile_name_filter, compile_stat_filter
+
+DATE_FORMAT = '%m/%d/%Y %H:%M:%S'
+
+# Ranking keys accepted by top_files, mapped to their stat attribute
+TOP_KEYS = {
+    'file_size': 'st_size',
+    'st_size': 'st_size',
+    'st_mtime': 'st_mtime',
+    'st_atime': 'st_atime',
+    'st_ctime': 'st_ctime',
+}
+
+# Batches buffered between per-mount walker threads and the consumer
+MOUNT_QUEUE_SIZE = 64
+# Files a per-mount walker collects before handing them over in one batch
+MOUNT_BATCH_FILES = 512
+
+def _read_dir(root):
+    with os.scandir(root) as it:
+        return list(it)
+
+def error_record(path, operation, error):
+    """Per-entry scan error, collected by scans instead of aborting them."""
+    return {
+        "path": path,
+        "operation": operation,
+        "errno": getattr(error, "errno", None),
+        "error": getattr(error, "strerror", None) or str(error),
+    }
+
+def _list_dir(root, accept=None, exclude_dirs=('venv',), prefetch_stat=False, throttle=None,
+              follow_symlinks=False, accept_dir=None, on_error=None):
+    """Read a single directory and return (file entries, subdirectory paths).
+
+    Only files whose name passes accept are returned. With prefetch_stat the
+    entries are stat'ed here, so the calling worker thread pays for those
+    syscalls and DirEntry.stat() is served from its cache afterwards. A
+    ScanThrottle, if given, paces the listing and every stat. Symlinked
+    subdirectories are only returned with follow_symlinks, and accept_dir
+    can veto any subdirectory entry. A directory that cannot be read is
+    passed to on_error, if given, as an error_record and treated as empty.
+    """
+    try:
+        entries = _read_dir(root) if throttle is None else throttle.call(_read_dir, root)
+    except OSError as e:
+        if on_error is not None:
+            on_error(error_record(root, "list", e))
+        return [], []
+
+    files = []
+    subdirs = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if (entry.name not in exclude_dirs and (follow_symlinks or not entry.is_symlink())
+                    and (accept_dir is None or accept_dir(entry))):
+                subdirs.append(entry.path)
+        elif accept is None or accept(entry.name):
+            if prefetch_stat:
+                try:
+                    entry.stat() if throttle is None else throttle.call(entry.stat)
+                except OSError:
+                    pass
+            files.append(entry)
+    return files, subdirs
+
+class _VisitedDirectories:
+    """Thread-safe set of (st_dev, st_ino) of the directories a walk has entered."""
+
+    def __init__(self, stat):
+        self._seen = {(stat.st_dev, stat.st_ino)}
+        self._lock = threading.Lock()
+
+    def first_visit(self, stat):
+        key = (stat.st_dev, stat.st_ino)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+
+def _directory_filter(visited=None, device=None, on_other_device=None):
+    """Build the accept_dir check for a walk, or None when every subdirectory is entered.
+
+    visited drops directories already entered, which is what stops symlink
+    cycles. device keeps the walk on one filesystem; subdirectories on
+    another one are skipped, or passed to on_other_device instead.
+    """
+    if visited is None and device is None:
+        return None
+
+    def accept_dir(entry):
+        try:
+            stat = entry.stat()
+        except OSError:
+            return False
+        if visited is not None and not visited.first_visit(stat):
+            return False
+        if device is not None and stat.st_dev != device:
+            if on_other_device is not None:
+                on_other_device(entry.path)
+            return False
+        return True
+
+    return accept_dir
+
+def _iter_files_parallel(path, accept, exclude_dirs, workers, ordered, prefetch_stat, on_directory, throttle,
+                         follow_symlinks, accept_dir, on_error):
+    pool = ThreadPoolExecutor(max_workers=workers)
+    # Keep a few directories per worker in flight so no thread sits idle
+    window = workers * 4
+
+    def submit(root):
+        return pool.submit(_list_dir, root, accept, exclude_dirs, prefetch_stat, throttle, follow_symlinks, accept_dir,
+                           on_error)
+
+    try:
+        if ordered:
+            # Depth-first stack of [path, future]: the top `window` directories
+            # are always being listed ahead of the consumer.
+            stack = [[path, None]]
+            while stack:
+                for item in stack[-window:]:
+                    if item[1] is None:
+                        item[1] = submit(item[0])
+                root, future = stack.pop()
+                files, subdirs = future.result()
+                if on_directory is not None:
+                    on_directory(root)
+                yield from files
+                stack.extend([subdir, None] for subdir in reversed(subdirs))
+        else:
+            # Shared queue of directories, results yielded as they complete
+            backlog = deque([path])
+            pending = {}
+            while backlog or pending:
+                while backlog and len(pending) < window:
+                    root = backlog.popleft()
+                    pending[submit(root)] = root
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    root = pending.pop(future)
+                    files, subdirs = future.result()
+                    if on_directory is not None:
+                        on_directory(root)
+                    backlog.extend(subdirs)
+                    yield from files
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _iter_files_per_mount(path, accept, exclude_dirs, workers, prefetch_stat, on_directory, throttle,
+                          follow_symlinks, on_error):
+    """Walk every filesystem below path on its own thread, yielding files from whichever lists next.
+
+    A slow network mount then only holds up its own part of the tree.
+    """
+    results = queue.Queue(maxsize=MOUNT_QUEUE_SIZE)
+    stop = threading.Event()
+    visited = _VisitedDirectories(os.stat(path)) if follow_symlinks else None
+
+    def send(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def walk(top):
+        try:
+            accept_dir = _directory_filter(visited, os.stat(top).st_dev, lambda mount: send(("mount", mount)))
+            stack = [top]
+            batch = []
+            batched_files = 0
+            while stack and not stop.is_set():
+                root = stack.pop()
+                files, subdirs = _list_dir(root, accept, exclude_dirs, prefetch_stat, throttle,
+                                           follow_symlinks, accept_dir, on_error)
+                batch.append((root, files))
+                batched_files += len(files)
+                stack.extend(reversed(subdirs))
+                # One queue handoff per batch rather than per directory keeps thread switching cheap
+                if batched_files >= MOUNT_BATCH_FILES or not stack:
+                    send(("directories", batch))
+                    batch = []
+                    batched_files = 0
+        except OSError as e:
+            if on_error is not None:
+                on_error(error_record(top, "list", e))
+        finally:
+            send(("done",))
+
+    # Daemon threads rather than a pool: a walker blocked on an abandoned consumer must not hold up exit
+    mounts = deque([path])
+    running = 0
+    try:
+        while mounts or running:
+            while mounts and running < max(workers or 1, 1):
+                threading.Thread(target=walk, args=(mounts.popleft(),), name="scan-mount", daemon=True).start()
+                running += 1
+            item = results.get()
+            if item[0] == "mount":
+                mounts.append(item[1])
+            elif item[0] == "done":
+                running -= 1
+            else:
+                for root, files in item[1]:
+                    if on_directory is not None:
+                        on_directory(root)
+                    yield from files
+    finally:
+        stop.set()
+
+def iter_files(path, accept=None, exclude_dirs=('venv',), workers=1, ordered=True, prefetch_stat=True,
+               index=None, on_directory=None, throttle=None, follow_symlinks=False, one_filesystem=False,
+               per_mount=False, on_error=None, checkpoint=None):
+    """Walk path with os.scandir and yield a DirEntry for every file.
+
+    Directories are visited top-down in the same order as os.walk, folders
+    named in exclude_dirs are skipped and symlinked directories are not
+    followed. With workers > 1 directories are listed by a thread pool;
+    ordered=False yields files as soon as any directory finishes. Passing a
+    ScanIndex serves unchanged directories from the index instead.
+    on_directory, if given, is called with each directory once it is listed.
+    With a ScanThrottle every listing and stat goes through its rate limit,
+    so files are always stat'ed during the walk.
+
+    follow_symlinks enters symlinked directories; every directory is entered
+    at most once, by (st_dev, st_ino), so link cycles end the descent.
+    one_filesystem stays on the filesystem of path, like find -xdev.
+    per_mount walks each filesystem below path on its own thread (up to
+    workers at once), yielding files unordered.
+
+    Directories that cannot be read are passed to on_error as
+    error_records. With a ScanCheckpoint the walk is sequential, starts
+    from the saved frontier when the checkpoint is resumed, and hands the
+    checkpoint the remaining stack between directories.
+    """
+    try:
+        if checkpoint is not None and (index is not None or follow_symlinks or per_mount):
+            raise ValueError("checkpointed scans cannot use a scan index, follow_symlinks or per_mount")
+        if index is not None:
+            if follow_symlinks:
+                raise ValueError("follow_symlinks is not supported with a scan index")
+            yield from index.iter_files(path, accept, exclude_dirs, on_directory, throttle, one_filesystem, on_error)
+            return
+
+        if throttle is not None:
+            prefetch_stat = True
+        if per_mount and not one_filesystem:
+            yield from _iter_files_per_mount(
+                path, accept, exclude_dirs, workers, prefetch_stat, on_directory, throttle, follow_symlinks, on_error
+            )
+            return
+
+        accept_dir = None
+        if follow_symlinks or one_filesystem:
+            root_stat = os.stat(path)
+            accept_dir = _directory_filter(
+                _VisitedDirectories(root_stat) if follow_symlinks else None,
+                root_stat.st_dev if one_filesystem else None,
+            )
+        if workers and workers > 1 and checkpoint is None:
+            yield from _iter_files_parallel(
+                path, accept, exclude_dirs, workers, ordered, prefetch_stat, on_directory, throttle,
+                follow_symlinks, accept_dir, on_error
+            )
+            return
+
+        stack = checkpoint.pending if checkpoint is not None and checkpoint.resumed else [path]
+        while stack:
+            # Every file yielded so far has been consumed, so the stack is a consistent frontier
+            if checkpoint is not None:
+                checkpoint.walked(stack)
+            root = stack.pop()
+            files, subdirs = _list_dir(root, accept, exclude_dirs, throttle is not None, throttle,
+                                       follow_symlinks, accept_dir, on_error)
+            if on_directory is not None:
+                on_directory(root)
+            yield from files
+            stack.extend(reversed(subdirs))
+    finally:
+        # The walk may have run on a pooled thread: hand it back its normal I/O priority
+        if throttle is not None:
+            throttle.restore()
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
+
+# Timestamp renderings a client can ask for; 'default' is the scanner's historic style
+TIME_FORMATS = {
+    'default': _format_time,
+    'iso': lambda timestamp: datetime.fromtimestamp(timestamp).isoformat(),
+    'epoch': lambda timestamp: timestamp,
+}
+
+class FileRecord:
+    """Lightweight scan result holding the raw epoch times of a file.
+
+    Timestamps are only rendered when to_dict() is called, which callers
+    that just aggregate sizes or filter further never need to do.
+    """
+
+    __slots__ = ('file_path', 'file_size', 'st_ctime', 'st_mtime', 'st_atime')
+
+    def __init__(self, file_path, file_size, st_ctime, st_mtime, st_atime):
+        self.file_path = file_path
+        self.file_size = file_size
+        self.st_ctime = st_ctime
+        self.st_mtime = st_mtime
+        self.st_atime = st_atime
+
+    @classmethod
+    def from_stat(cls, file_path, stat):
+        return cls(file_path, stat.st_size, stat.st_ctime, stat.st_mtime, stat.st_atime)
+
+    def __repr__(self):
+        return f"FileRecord({self.file_path!r}, {self.file_size})"
+
+    def to_dict(self, time_format='default'):
+        """Render the record in the scan_directory dict shape."""
+        return _file_record(self.file_path, self.file_size, self.st_ctime, self.st_mtime, self.st_atime, time_format)
+
+def _file_record(file_path, file_size, ctime, mtime, atime, time_format='default'):
+    """Build the dict yielded by scan_directory for one file from its raw epoch times.
+
+    Every scan record, whether from a walk, a FileRecord or an inventory
+    row, is rendered here so they all share one shape.
+    """
+    render = TIME_FORMATS[time_format]
+    return {
+        "file_path": file_path,
+        "file_size": file_size,
+        "date_created": render(ctime),
+        "date_modified": render(mtime),
+        "date_accessed": render(atime),
+    }
+
+def _scan_entries(
+    path, exclude_hidden=True, exclude_pyc=True, exclude_init=True,
+    min_size=None, max_size=None, extensions=None,
+    date_created_range=None, date_modified_range=None, date_accessed_range=None,
+    workers=1, ordered=True, index=None,
+    include=None, exclude=None, include_regex=None, exclude_regex=None, on_directory=None, throttle=None,
+    follow_symlinks=False, one_filesystem=False, per_mount=False, on_error=None, checkpoint=None
+):
+    """Yield (file path, stat) for every file that passes the scan_directory filters.
+
+    Files and directories that vanish or cannot be read are skipped and
+    reported to on_error as error_records. A resumed ScanCheckpoint first
+    replays the files and errors it saved, then the walk carries on from
+    its frontier; the checkpoint is removed once the walk completes.
+    """
+    accept = compile_name_filter(
+        exclude_hidden, exclude_pyc, exclude_init, extensions, include, exclude, include_regex, exclude_regex
+    )
+    check = compile_stat_filter(min_size, max_size, date_created_range, date_modified_range, date_accessed_range)
+
+    def report(record):
+        if checkpoint is not None:
+            checkpoint.add_error(record)
+        if on_error is not None:
+            on_error(record)
+
+    if checkpoint is not None:
+        for kind, *row in checkpoint.replay():
+            if kind == "file":
+                yield tuple(row)
+            elif on_error is not None:
+                on_error(row[0])
+
+    for entry in iter_files(path, accept=accept, workers=workers, ordered=ordered, index=index,
+                            on_directory=on_directory, throttle=throttle, follow_symlinks=follow_symlinks,
+                            one_filesystem=one_filesystem, per_mount=per_mount, on_error=report,
+                            checkpoint=checkpoint):
+        # A single stat serves the size filter and the file times
+        try:
+            stat = entry.stat()
+        except OSError as e:
+            # Broken symlinks and files deleted since the listing
+            report(error_record(entry.path, "stat", e))
+            continue
+        if check is None or check(stat):
+            if checkpoint is not None:
+                checkpoint.add_file(entry.path, stat)
+            yield entry.path, stat
+
+    if checkpoint is not None:
+        checkpoint.complete()
 
 def scan_directory(
     path, exclude_hidden=True, exclude_pyc=True, exclude_init=True,
     min_size=None, max_size=None, extensions=None,
-    date_created_range=None, date_modified_range=None, date_accessed_range=None
+    date_created_range=None, date_modified_range=None, date_accessed_range=None,
+    workers=1, ordered=True, index=None,
+    include=None, exclude=None, include_regex=None, exclude_regex=None,
+    raw=False, time_format='default', throttle=None,
+    follow_symlinks=False, one_filesystem=False, per_mount=False, on_error=None, checkpoint=None
 ):
+    """Yield a record for every file under path that passes the filters.
+
+    Records are dicts with times rendered in time_format ('default', 'iso' or
+    'epoch'); raw=True yields FileRecord objects and skips the formatting.
+    Pass a ScanThrottle to rate limit the walk on busy machines;
+    follow_symlinks, one_filesystem and per_mount are as for iter_files.
+
+    A file or directory that cannot be read no longer aborts the scan: it
+    is skipped and passed to on_error as an error_record. With a
+    ScanCheckpoint a scan interrupted by a crash or restart picks up where
+    its last checkpoint left off, yielding the files found before it first.
+    """
+    if time_format not in TIME_FORMATS:
+        raise ValueError(f"Unsupported time format: {time_format}. Expected one of {', '.join(TIME_FORMATS)}.")
+    try:
+        for file_path, stat in _scan_entries(
+            path, exclude_hidden, exclude_pyc, exclude_init, min_size, max_size, extensions,
+            date_created_range, date_modified_range, date_accessed_range, workers, ordered, index,
+            include, exclude, include_regex, exclude_regex, throttle=throttle,
+            follow_symlinks=follow_symlinks, one_filesystem=one_filesystem, per_mount=per_mount,
+            on_error=on_error, checkpoint=checkpoint
+        ):
+            if raw:
+                yield FileRecord.from_stat(file_path, stat)
+            else:
+                yield _file_record(file_path, stat.st_size, stat.st_ctime, stat.st_mtime, stat.st_atime, time_format)
+    except Exception as e:
+        raise Exception(f"Error scanning directory {path}: {e}")
+
+class TopFiles:
+    """Keep the k highest (or lowest) ranked files seen so far in a bounded heap.
+
+    key is one of TOP_KEYS; memory stays O(k) however many files are pushed.
+    """
+
+    def __init__(self, k, key='file_size', largest=True):
+        if key not in TOP_KEYS:
+            raise ValueError(f"Unsupported top-k key: {key}. Expected one of {', '.join(TOP_KEYS)}.")
+        if k < 1:
+            raise ValueError(f"top must be at least 1, got {k}")
+        self.k = k
+        self._attr = TOP_KEYS[key]
+        self._sign = 1 if largest else -1
+        self._heap = []
+        self._seen = 0
+
+    def push(self, file_path, stat):
+        # Ties keep the file seen first, hence the negated arrival counter
+        item = (self._sign * getattr(stat, self._attr), -self._seen, file_path, stat)
+        self._seen += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+
+    def results(self, time_format='default'):
+        """Return the kept files as scan records, best first."""
+        return [
+            _file_record(file_path, stat.st_size, stat.st_ctime, stat.st_mtime, stat.st_atime, time_format)
+            for _, _, file_path, stat in sorted(self._heap, reverse=True)
+        ]
+
+def top_files(path, k=100, key='file_size', largest=True, time_format='default', **scan_options):
+    """Return the k largest (or smallest, with largest=False) files under path by key.
+
+    Accepts the scan_directory filters, e.g. date_accessed_range to find the
+    biggest files nobody has opened in a year.
+    """
+    top = TopFiles(k, key, largest)
     try:
-        for root, dirs, files in os.walk(path):
-            if 'venv' in dirs:
-                dirs.remove('venv')
-
-            for file in files:
-                # Skip hidden files
-                if exclude_hidden and file.startswith('.'):
-                    continue
-                if exclude_pyc and file.endswith('.pyc'):
-                    continue
-                if exclude_init and file == '__init__.py':
-                    continue
-                
-                # Apply extensions filter
-                if extensions:
-                    file_extension = os.path.splitext(file)[1].lower()
-                    if file_extension not in extensions:
-                        continue
-
-                file_path = os.path.join(root, file)
-                file_size = os.path.getsize(file_path)
-
-                # Check size filters
-                if min_size and file_size < min_size:
-                    continue
-                if max_size and file_size > max_size:
-                    continue
-
-                # Fetch file times
-                stat = os.stat(file_path)
-                date_created = datetime.fromtimestamp(stat.st_ctime)
-                date_modified = datetime.fromtimestamp(stat.st_mtime)
-                date_accessed = datetime.fromtimestamp(stat.st_atime)
-
-                # Check date ranges
-                if date_created_range and not (date_created_range[0] <= date_created <= date_created_range[1]):
-                    continue
-                if date_modified_range and not (date_modified_range[0] <= date_modified <= date_modified_range[1]):
-                    continue
-                if date_accessed_range and not (date_accessed_range[0] <= date_accessed <= date_accessed_range[1]):
-                    continue
-
-                yield {
-                    "file_path": file_path,
-                    "file_size": file_size,
-                    "date_created": date_created.strftime('%m/%d/%Y %H:%M:%S'),
-                    "date_modified": date_modified.strftime('%m/%d/%Y %H:%M:%S'),
-                    "date_accessed": date_accessed.strftime('%m/%d/%Y %H:%M:%S'),
-                }
+        for file_path, stat in _scan_entries(path, **scan_options):
+            top.push(file_path, stat)
     except Exception as e:
         raise Exception(f"Error scanning directory {path}: {e}")
+    return top.results(time_format)
@@ -0,0 +1,463 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from backend.utils.file_scanner import FileRecord, _list_dir, iter_files
+from backend.utils.scan_filters import compile_name_filter, compile_stat_filter
+from backend.utils.scan_index import ScanIndex
+from backend.utils.trends import TrendSummary, record_trends
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONTFOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONTFOLLOW
+)
+
+_EVENT = struct.Struct("iIII")
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+_libc = _load_libc()
+
+class InventoryRecord(FileRecord):
+    """FileRecord that also keeps the stat fields disk usage and duplicate detection read.
+
+    It can stand in for the file's stat result, so queries over the
+    inventory are answered from memory without a syscall per file.
+    """
+
+    __slots__ = ('st_dev', 'st_ino', 'st_nlink', 'st_blocks')
+
+    def __init__(self, file_path, file_size, st_ctime, st_mtime, st_atime, st_dev, st_ino, st_nlink, st_blocks):
+        super().__init__(file_path, file_size, st_ctime, st_mtime, st_atime)
+        self.st_dev = st_dev
+        self.st_ino = st_ino
+        self.st_nlink = st_nlink
+        self.st_blocks = st_blocks
+
+    @property
+    def st_size(self):
+        return self.file_size
+
+# One packed row per file: size, ctime, mtime, atime, dev, ino, nlink, blocks (-1 when unknown)
+_ROW = struct.Struct("=qdddQQIq")
+
+def _pack_row(stat):
+    blocks = getattr(stat, 'st_blocks', None)
+    return _ROW.pack(stat.st_size, stat.st_ctime, stat.st_mtime, stat.st_atime,
+                     stat.st_dev, stat.st_ino, stat.st_nlink, -1 if blocks is None else blocks)
+
+def pack_directory(files):
+    """Pack (file name, stat) pairs into the (names, rows) form FileInventory keeps per directory."""
+    names = [b""]
+    rows = []
+    for name, stat in files:
+        names.append(os.fsencode(name))
+        rows.append(_pack_row(stat))
+    names.append(b"")
+    return b"\0".join(names) if rows else b"\0", b"".join(rows)
+
+class FileInventory:
+    """Thread-safe in-memory map of directory -> the stat fields of its files.
+
+    Each directory holds two immutable byte strings: its file names, each
+    one NUL terminated after a leading NUL, and a fixed-size _ROW per file
+    in the same order. That is around 60 bytes plus the name per file,
+    rather than a dict entry, a record and its boxed numbers, so large
+    trees stay affordable in the API process. A name is found with one
+    bytes.find, and an event rebuilds only its own directory's strings,
+    which readers may still be iterating over. InventoryRecords are made
+    on the fly when records are read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirs = {}
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(rows) // _ROW.size for _, rows in self._dirs.values())
+
+    @staticmethod
+    def _find(names, name):
+        """Index of name in a names string and its byte offset there, or (-1, -1)."""
+        offset = names.find(b"\0" + name + b"\0")
+        return (-1, -1) if offset < 0 else (names.count(b"\0", 0, offset), offset)
+
+    def set_file(self, directory, name, stat):
+        name = os.fsencode(name)
+        row = _pack_row(stat)
+        with self._lock:
+            names, rows = self._dirs.get(directory, (b"\0", b""))
+            i, _ = self._find(names, name)
+            if i < 0:
+                self._dirs[directory] = (names + name + b"\0", rows + row)
+            else:
+                self._dirs[directory] = (names, rows[:i * _ROW.size] + row + rows[(i + 1) * _ROW.size:])
+
+    def remove_file(self, directory, name):
+        name = os.fsencode(name)
+        with self._lock:
+            files = self._dirs.get(directory)
+            if files is None:
+                return
+            names, rows = files
+            i, offset = self._find(names, name)
+            if i >= 0:
+                self._dirs[directory] = (
+                    names[:offset + 1] + names[offset + len(name) + 2:],
+                    rows[:i * _ROW.size] + rows[(i + 1) * _ROW.size:],
+                )
+
+    def set_directory(self, directory, files):
+        """Replace the files of one directory with packed (names, rows), see pack_directory."""
+        with self._lock:
+            self._dirs[directory] = files
+
+    def remove_tree(self, directory):
+        prefix = directory + os.sep
+        with self._lock:
+            for path in [d for d in self._dirs if d == directory or d.startswith(prefix)]:
+                del self._dirs[path]
+
+    def replace(self, dirs, keep=()):
+        """Swap in a freshly scanned {directory: packed files} map, keeping the current entries of directories in keep."""
+        with self._lock:
+            for directory in keep:
+                if directory in self._dirs:
+                    dirs[directory] = self._dirs[directory]
+            self._dirs = dirs
+
+    def records(self, directory=None):
+        """Yield InventoryRecords for the files at or below directory (everything by default).
+
+        The directories are picked under the lock; their records are
+        built afterwards from strings no writer changes.
+        """
+        if directory is not None:
+            directory = os.path.abspath(directory)
+            prefix = directory + os.sep
+        with self._lock:
+            selected = [
+                (path, files) for path, files in self._dirs.items()
+                if directory is None or path == directory or path.startswith(prefix)
+            ]
+        for path, (names, rows) in selected:
+            for name, row in zip(names[1:-1].split(b"\0"), _ROW.iter_unpack(rows)):
+                size, ctime, mtime, atime, dev, ino, nlink, blocks = row
+                yield InventoryRecord(os.path.join(path, os.fsdecode(name)), size, ctime, mtime, atime,
+                                      dev, ino, nlink, None if blocks < 0 else blocks)
+
+class InventoryWatcher(threading.Thread):
+    """Keep a FileInventory of a directory tree current using inotify.
+
+    At most max_watches directories are watched. Once that budget or the
+    kernel's watch limit is exhausted, or when inotify is unavailable, the
+    watcher degrades to incremental rescans through a ScanIndex every
+    rescan_interval seconds. With a trends_path, totals of the inventory
+    are recorded in that TrendStore once loaded and then every
+    trend_interval seconds.
+    """
+
+    def __init__(self, root, max_watches=8192, rescan_interval=300, index_path=":memory:", trends_path=None,
+                 trend_interval=300):
+        super().__init__(daemon=True, name=f"inventory-watcher:{root}")
+        self.root = os.path.abspath(root)
+        self.max_watches = max_watches
+        self.rescan_interval = rescan_interval
+        self.index_path = index_path
+        self.trends_path = trends_path
+        self.trend_interval = trend_interval
+        self.inventory = FileInventory()
+        self.degraded = False
+        self.ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._fd = -1
+        self._wd_paths = {}
+        self._path_wds = {}
+        self._index = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    @property
+    def watch_count(self):
+        return len(self._wd_paths)
+
+    def covers(self, directory):
+        directory = os.path.abspath(directory)
+        return directory == self.root or directory.startswith(self.root + os.sep)
+
+    # -- watch bookkeeping -------------------------------------------------
+
+    def _add_watch(self, path):
+        if self._fd < 0 or len(self._wd_paths) >= self.max_watches:
+            self._degrade("watch budget of %d directories exhausted" % self.max_watches)
+            return False
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                self._degrade("kernel inotify watch limit reached")
+            elif err not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                logger.warning("inotify_add_watch failed for %s: %s", path, os.strerror(err))
+            return False
+        self._wd_paths[wd] = path
+        self._path_wds[path] = wd
+        return True
+
+    def _forget_watches(self, directory):
+        prefix = directory + os.sep
+        for path in [p for p in self._path_wds if p == directory or p.startswith(prefix)]:
+            wd = self._path_wds.pop(path)
+            self._wd_paths.pop(wd, None)
+            _libc.inotify_rm_watch(self._fd, wd)
+
+    def _degrade(self, reason):
+        if not self.degraded:
+            logger.warning("Inventory watcher for %s falling back to periodic rescans: %s", self.root, reason)
+            self.degraded = True
+
+    # -- loading -----------------------------------------------------------
+
+    def _load_tree(self, top):
+        """Walk top, watching each directory and recording all of its files."""
+        stack = [top]
+        while stack:
+            root = stack.pop()
+            if not self.degraded:
+                self._add_watch(root)
+            files, subdirs = _list_dir(root, exclude_dirs=(), prefetch_stat=True)
+            stats = []
+            for entry in files:
+                try:
+                    stats.append((entry.name, entry.stat()))
+                except OSError:
+                    continue
+            self.inventory.set_directory(root, pack_directory(stats))
+            stack.extend(reversed(subdirs))
+
+    def rescan(self):
+        """Rebuild the inventory through the scan index; only changed directories are re-read."""
+        if self._index is None:
+            # Opened on the watcher thread, which is the only one using it
+            self._index = ScanIndex(self.index_path)
+        # Directories that still have a watch are kept current by their events
+        watched = set(self._path_wds)
+        dirs = {}
+        # The walk yields each directory's files together, so each one is packed as soon as it is done
+        directory, stats = None, []
+        for entry in iter_files(self.root, exclude_dirs=(), index=self._index):
+            parent = os.path.dirname(entry.path)
+            if parent != directory:
+                if stats:
+                    dirs[directory] = pack_directory(stats)
+                directory, stats = parent, []
+            if parent in watched:
+                continue
+            try:
+                stats.append((entry.name, entry.stat()))
+            except OSError:
+                continue
+        if stats:
+            dirs[directory] = pack_directory(stats)
+        self.inventory.replace(dirs, keep=watched)
+
+    def capture_trends(self):
+        """Record the current totals of the inventory, without touching the disk.
+
+        Files a default scan would skip are left out, so these points line
+        up with the ones recorded by scan jobs of the same root.
+        """
+        accept = compile_name_filter()
+        venv = os.sep + "venv" + os.sep
+        summary = TrendSummary(self.root)
+        for record in self.inventory.records():
+            if accept(os.path.basename(record.file_path)) and venv not in record.file_path:
+                summary.add(record.file_path, record.file_size)
+        record_trends(self.trends_path, summary)
+
+    def entries(self, directory=None, exclude_hidden=True, exclude_pyc=True, exclude_init=True, extensions=None,
+                min_size=None, max_size=None, exclude_dirs=('venv',)):
+        """Yield (file path, record) for the inventoried files a walk of directory would yield.
+
+        Nothing is read from disk: the InventoryRecord stands in for the
+        stat result, and files under a directory named in exclude_dirs are
+        left out as the walk leaves them out. Paths start with directory as
+        given, so they match what walking it would have produced.
+        """
+        root = self.root if directory is None else os.path.abspath(directory)
+        shown = root if directory is None else directory.rstrip(os.sep) or os.sep
+        prefix = root.rstrip(os.sep) + os.sep
+        accept = compile_name_filter(exclude_hidden, exclude_pyc, exclude_init, extensions)
+        check = compile_stat_filter(min_size, max_size)
+        for record in self.inventory.records(root):
+            relative = record.file_path[len(prefix):]
+            parts = relative.split(os.sep)
+            if accept is not None and not accept(parts[-1]):
+                continue
+            if exclude_dirs and any(part in exclude_dirs for part in parts[:-1]):
+                continue
+            if check is None or check(record):
+                yield (record.file_path if shown == root else os.path.join(shown, relative)), record
+
+    # -- event handling ----------------------------------------------------
+
+    def _refresh_file(self, directory, name):
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path, follow_symlinks=True)
+        except OSError:
+            self.inventory.remove_file(directory, name)
+            return
+        self.inventory.set_file(directory, name, stat)
+
+    def _handle_events(self, data):
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; only a full reload is trustworthy
+                logger.warning("inotify queue overflow, reloading %s", self.root)
+                self._forget_watches(self.root)
+                self.inventory.replace({})
+                self._load_tree(self.root)
+                continue
+
+            directory = self._wd_paths.get(wd)
+            if mask & IN_IGNORED:
+                if directory is not None:
+                    self._wd_paths.pop(wd, None)
+                    self._path_wds.pop(directory, None)
+                continue
+            if directory is None or not name:
+                continue
+
+            name = os.fsdecode(name)
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._forget_watches(path)
+                    self.inventory.remove_tree(path)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    self._load_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.inventory.remove_file(directory, name)
+            else:
+                self._refresh_file(directory, name)
+
+    # -- thread body -------------------------------------------------------
+
+    def run(self):
+        if _libc is not None:
+            self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if self._fd < 0:
+                self._degrade("inotify_init1 failed: %s" % os.strerror(ctypes.get_errno()))
+        else:
+            self._degrade("inotify is not available on this platform")
+
+        try:
+            if self.degraded:
+                self.rescan()
+            else:
+                self._load_tree(self.root)
+            self.ready.set()
+
+            next_rescan = time.monotonic() + self.rescan_interval
+            next_capture = time.monotonic()
+            while not self._stop_event.is_set():
+                if self._fd >= 0:
+                    readable, _, _ = select.select([self._fd], [], [], 1.0)
+                    if readable:
+                        try:
+                            self._handle_events(os.read(self._fd, 64 * 1024))
+                        except BlockingIOError:
+                            pass
+                else:
+                    self._stop_event.wait(1.0)
+
+                if self.degraded and time.monotonic() >= next_rescan:
+                    self.rescan()
+                    next_rescan = time.monotonic() + self.rescan_interval
+                if self.trends_path and time.monotonic() >= next_capture:
+                    self.capture_trends()
+                    next_capture = time.monotonic() + self.trend_interval
+        except Exception as e:
+            logger.error(f"Inventory watcher for {self.root} stopped: {e}")
+        finally:
+            self.ready.set()
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+            if self._index is not None:
+                self._index.close()
+
+# Running watchers keyed by their root directory
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+def start_watcher(root, **kwargs):
+    """Start (or return the already running) watcher for root."""
+    root = os.path.abspath(root)
+    with _watchers_lock:
+        watcher = _watchers.get(root)
+        if watcher is None or not watcher.is_alive():
+            watcher = InventoryWatcher(root, **kwargs)
+            watcher.start()
+            _watchers[root] = watcher
+        return watcher
+
+def stop_watcher(root):
+    with _watchers_lock:
+        watcher = _watchers.pop(os.path.abspath(root), None)
+    if watcher is not None:
+        watcher.stop()
+    return watcher
+
+def find_watcher(directory):
+    """Return a ready watcher whose tree contains directory, if any."""
+    with _watchers_lock:
+        watchers = list(_watchers.values())
+    for watcher in watchers:
+        if watcher.is_alive() and watcher.ready.is_set() and watcher.covers(directory):
+            return watcher
+    return None
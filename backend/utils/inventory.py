@@ -0,0 +1,240 @@
+import os
+from array import array
+from datetime import datetime
+
+from backend.utils.file_scanner import DATE_FORMAT, _file_record, iter_files
+from backend.utils.scan_filters import compile_name_filter
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the array module covers everything
+    np = None
+
+# Columns that can be used as sort keys, by scan record field name
+SORT_KEYS = {
+    "file_size": "sizes",
+    "date_created": "ctimes",
+    "date_modified": "mtimes",
+    "date_accessed": "atimes",
+}
+
+def _parse_time(value):
+    """Turn a record timestamp (epoch, ISO string or scanner format) into epoch seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return datetime.strptime(value, DATE_FORMAT).timestamp()
+
+def _intern(table, ids, value):
+    index = ids.get(value)
+    if index is None:
+        index = ids[value] = len(table)
+        table.append(value)
+    return index
+
+def _as_index_array(values):
+    indices = array('Q')
+    if np is not None and isinstance(values, np.ndarray):
+        indices.frombytes(values.astype(np.uint64).tobytes())
+    else:
+        indices.extend(values)
+    return indices
+
+class ColumnarInventory:
+    """Compact file inventory stored as parallel typed columns.
+
+    Sizes and times live in array columns, directories and extensions are
+    interned into lookup tables referenced by integer ids, and file names are
+    packed into a single byte buffer. Queries work on whole columns at once,
+    through numpy when it is installed, and hand back index arrays that can
+    be fed to the next query or turned into records.
+    """
+
+    def __init__(self):
+        self.dirs = []
+        self.extensions = []
+        self._dir_ids = {}
+        self._ext_ids = {}
+        self.dir_ids = array('I')
+        self.ext_ids = array('I')
+        self.sizes = array('q')
+        self.ctimes = array('d')
+        self.mtimes = array('d')
+        self.atimes = array('d')
+        self._names = bytearray()
+        self._name_ends = array('Q')
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def append(self, file_path, file_size, ctime, mtime, atime):
+        directory, name = os.path.split(file_path)
+        self.dir_ids.append(_intern(self.dirs, self._dir_ids, directory))
+        self.ext_ids.append(_intern(self.extensions, self._ext_ids, os.path.splitext(name)[1].lower()))
+        self.sizes.append(file_size)
+        self.ctimes.append(ctime)
+        self.mtimes.append(mtime)
+        self.atimes.append(atime)
+        self._names += os.fsencode(name)
+        self._name_ends.append(len(self._names))
+
+    @classmethod
+    def from_scan(cls, path, workers=1, exclude_hidden=True, exclude_pyc=True, exclude_init=True, extensions=None):
+        """Build an inventory straight from a directory walk, keeping raw stat times."""
+        inventory = cls()
+        accept = compile_name_filter(exclude_hidden, exclude_pyc, exclude_init, extensions)
+        for entry in iter_files(path, accept=accept, workers=workers):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            inventory.append(entry.path, stat.st_size, stat.st_ctime, stat.st_mtime, stat.st_atime)
+        return inventory
+
+    @classmethod
+    def from_records(cls, records):
+        """Build an inventory from scan_directory or file_details.json style records."""
+        inventory = cls()
+        for record in records:
+            inventory.append(
+                record["file_path"],
+                record["file_size"],
+                _parse_time(record["date_created"]),
+                _parse_time(record["date_modified"]),
+                _parse_time(record["date_accessed"]),
+            )
+        return inventory
+
+    @classmethod
+    def from_grouped(cls, grouped):
+        """Build an inventory from a {".ext": [records]} mapping like file_details.json."""
+        return cls.from_records(record for records in grouped.values() for record in records)
+
+    # -- single rows -------------------------------------------------------
+
+    def name(self, i):
+        start = self._name_ends[i - 1] if i else 0
+        return os.fsdecode(bytes(self._names[start:self._name_ends[i]]))
+
+    def path(self, i):
+        return os.path.join(self.dirs[self.dir_ids[i]], self.name(i))
+
+    def extension(self, i):
+        return self.extensions[self.ext_ids[i]]
+
+    def record(self, i, time_format='default'):
+        """Return row i in the scan_directory record shape."""
+        return _file_record(self.path(i), self.sizes[i], self.ctimes[i], self.mtimes[i], self.atimes[i], time_format)
+
+    def records(self, indices=None, time_format='default'):
+        for i in (range(len(self)) if indices is None else indices):
+            yield self.record(i, time_format)
+
+    def nbytes(self):
+        """Approximate memory held by the columns and lookup tables."""
+        columns = (self.dir_ids, self.ext_ids, self.sizes, self.ctimes, self.mtimes, self.atimes, self._name_ends)
+        total = sum(column.buffer_info()[1] * column.itemsize for column in columns) + len(self._names)
+        total += sum(len(d) + 50 for d in self.dirs) + sum(len(e) + 50 for e in self.extensions)
+        return total
+
+    # -- bulk queries ------------------------------------------------------
+
+    def _column(self, name):
+        column = getattr(self, name)
+        if np is None:
+            return column
+        return np.frombuffer(column, dtype=column.typecode) if len(column) else np.array([], dtype=column.typecode)
+
+    def _matching_dir_ids(self, directory):
+        directory = directory.rstrip(os.sep) or os.sep
+        prefix = directory if directory.endswith(os.sep) else directory + os.sep
+        return [i for i, d in enumerate(self.dirs) if d == directory or d.startswith(prefix)]
+
+    def select(self, min_size=None, max_size=None, extensions=None, directory=None,
+               modified_after=None, modified_before=None, accessed_before=None):
+        """Return the indices of rows matching every given condition."""
+        ext_ids = None
+        if extensions is not None:
+            ext_ids = {self._ext_ids[ext.lower()] for ext in extensions if ext.lower() in self._ext_ids}
+        dir_ids = None if directory is None else set(self._matching_dir_ids(directory))
+
+        if np is not None:
+            mask = np.ones(len(self), dtype=bool)
+            sizes = self._column("sizes")
+            if min_size is not None:
+                mask &= sizes >= min_size
+            if max_size is not None:
+                mask &= sizes <= max_size
+            if ext_ids is not None:
+                mask &= np.isin(self._column("ext_ids"), list(ext_ids))
+            if dir_ids is not None:
+                mask &= np.isin(self._column("dir_ids"), list(dir_ids))
+            if modified_after is not None:
+                mask &= self._column("mtimes") >= modified_after
+            if modified_before is not None:
+                mask &= self._column("mtimes") <= modified_before
+            if accessed_before is not None:
+                mask &= self._column("atimes") <= accessed_before
+            return _as_index_array(np.flatnonzero(mask))
+
+        checks = []
+        if min_size is not None:
+            checks.append(lambda i: self.sizes[i] >= min_size)
+        if max_size is not None:
+            checks.append(lambda i: self.sizes[i] <= max_size)
+        if ext_ids is not None:
+            checks.append(lambda i: self.ext_ids[i] in ext_ids)
+        if dir_ids is not None:
+            checks.append(lambda i: self.dir_ids[i] in dir_ids)
+        if modified_after is not None:
+            checks.append(lambda i: self.mtimes[i] >= modified_after)
+        if modified_before is not None:
+            checks.append(lambda i: self.mtimes[i] <= modified_before)
+        if accessed_before is not None:
+            checks.append(lambda i: self.atimes[i] <= accessed_before)
+        return _as_index_array(i for i in range(len(self)) if all(check(i) for check in checks))
+
+    def sort(self, key="file_size", reverse=False, indices=None, limit=None):
+        """Return indices ordered by one of SORT_KEYS, optionally only the first limit."""
+        column_name = SORT_KEYS[key]
+        if np is not None:
+            column = self._column(column_name)
+            rows = np.arange(len(self)) if indices is None else np.frombuffer(_as_index_array(indices), dtype=np.uint64)
+            # Descending order negates the keys rather than reversing, so ties keep row order as sorted() does
+            keys = column[rows]
+            order = rows[np.argsort(-keys if reverse else keys, kind="stable")]
+            return _as_index_array(order[:limit])
+
+        column = getattr(self, column_name)
+        rows = range(len(self)) if indices is None else indices
+        return _as_index_array(sorted(rows, key=column.__getitem__, reverse=reverse)[:limit])
+
+    def group_by(self, by="extension", indices=None):
+        """Return {extension or directory: {"count", "total_size"}} over the given rows."""
+        ids_name, table = ("ext_ids", self.extensions) if by == "extension" else ("dir_ids", self.dirs)
+
+        if np is not None:
+            ids = self._column(ids_name)
+            sizes = self._column("sizes")
+            if indices is not None:
+                rows = np.frombuffer(_as_index_array(indices), dtype=np.uint64)
+                ids, sizes = ids[rows], sizes[rows]
+            counts = np.bincount(ids, minlength=len(table))
+            totals = np.bincount(ids, weights=sizes, minlength=len(table))
+            return {
+                table[i]: {"count": int(counts[i]), "total_size": int(totals[i])}
+                for i in np.flatnonzero(counts)
+            }
+
+        ids = getattr(self, ids_name)
+        counts = [0] * len(table)
+        totals = [0] * len(table)
+        for i in (range(len(self)) if indices is None else indices):
+            counts[ids[i]] += 1
+            totals[ids[i]] += self.sizes[i]
+        return {
+            table[i]: {"count": counts[i], "total_size": totals[i]}
+            for i in range(len(table)) if counts[i]
+        }
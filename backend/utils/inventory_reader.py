@@ -0,0 +1,113 @@
+import json
+
+from backend.utils.inventory import ColumnarInventory
+
+CHUNK_SIZE = 64 * 1024
+# A single record larger than this means the document is malformed, not that it is big
+MAX_VALUE_SIZE = 16 * 1024 * 1024
+_WHITESPACE = " \t\n\r"
+
+class _Reader:
+    """Sliding text buffer over a file; only the unparsed tail is kept in memory."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read another chunk; returns False once the file is exhausted."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has already been consumed before growing the buffer
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars or not char:
+            raise ValueError(f"Expected one of {chars!r} but found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self, decoder):
+        """Decode the next complete JSON value, reading more of the file as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if len(self.buf) - self.pos > MAX_VALUE_SIZE or not self.fill():
+                    raise
+                continue
+            # A number at the very end of the buffer might continue in the next chunk
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_grouped_records(source, chunk_size=CHUNK_SIZE):
+    """Yield (extension, record) pairs from a {".ext": [records]} JSON document.
+
+    source is a path or a text file object. The document is parsed
+    incrementally, so memory stays at about one chunk plus one record no
+    matter how large the file is.
+    """
+    if isinstance(source, (str, bytes)) or hasattr(source, "__fspath__"):
+        with open(source, encoding="utf-8") as f:
+            yield from iter_grouped_records(f, chunk_size)
+        return
+
+    reader = _Reader(source, chunk_size)
+    decoder = json.JSONDecoder()
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        extension = reader.value(decoder)
+        reader.expect(":")
+        reader.expect("[")
+        if reader.peek() == "]":
+            reader.pos += 1
+        else:
+            while True:
+                yield extension, reader.value(decoder)
+                if reader.expect(",]") == "]":
+                    break
+        if reader.expect(",}") == "}":
+            return
+
+def iter_records(source, chunk_size=CHUNK_SIZE):
+    """Yield just the records of a grouped inventory document."""
+    for _, record in iter_grouped_records(source, chunk_size):
+        yield record
+
+def summarize(source, chunk_size=CHUNK_SIZE):
+    """Per-extension file counts and byte totals, computed without holding any records."""
+    totals = {}
+    for extension, record in iter_grouped_records(source, chunk_size):
+        summary = totals.setdefault(extension, {"count": 0, "total_size": 0})
+        summary["count"] += 1
+        summary["total_size"] += record.get("file_size", 0)
+    return totals
+
+def load_inventory(source, chunk_size=CHUNK_SIZE):
+    """Stream a grouped inventory document straight into a ColumnarInventory."""
+    return ColumnarInventory.from_records(iter_records(source, chunk_size))
@@ -0,0 +1,232 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime
+
+from backend.utils.file_scanner import _file_record
+from backend.utils.inventory import ColumnarInventory
+from backend.utils.inventory_reader import load_inventory
+
+# File layout: header, section table, then 8-byte aligned sections.
+MAGIC = b"CAPINV\x00\x01"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")  # magic, version, little-endian flag, files, dirs, extensions
+SECTION = struct.Struct("<QQ")  # offset, length in bytes
+SECTIONS = (
+    "dirs", "extensions", "dir_ids", "ext_ids", "sizes",
+    "ctimes", "mtimes", "atimes", "name_ends", "names",
+)
+# Typecodes of the fixed-width columns; times are integer microseconds since the epoch
+COLUMN_TYPES = {
+    "dir_ids": "I",
+    "ext_ids": "I",
+    "sizes": "q",
+    "ctimes": "q",
+    "mtimes": "q",
+    "atimes": "q",
+    "name_ends": "Q",
+}
+PREFIX = struct.Struct("<HH")  # bytes shared with the previous directory, suffix length
+
+def _encode_dirs(dirs):
+    """Front-code sorted directory paths: each one stores only what differs from its predecessor."""
+    out = bytearray()
+    previous = b""
+    for directory in dirs:
+        encoded = os.fsencode(directory)
+        shared = 0
+        limit = min(len(previous), len(encoded), 0xFFFF)
+        while shared < limit and previous[shared] == encoded[shared]:
+            shared += 1
+        suffix = encoded[shared:]
+        out += PREFIX.pack(shared, len(suffix)) + suffix
+        previous = encoded
+    return bytes(out)
+
+def _decode_dirs(data, count):
+    dirs = []
+    previous = b""
+    offset = 0
+    for _ in range(count):
+        shared, length = PREFIX.unpack_from(data, offset)
+        offset += PREFIX.size
+        previous = previous[:shared] + bytes(data[offset:offset + length])
+        offset += length
+        dirs.append(os.fsdecode(previous))
+    return dirs
+
+def _encode_strings(values):
+    out = bytearray()
+    for value in values:
+        encoded = value.encode("utf-8", "surrogateescape")
+        out += struct.pack("<H", len(encoded)) + encoded
+    return bytes(out)
+
+def _decode_strings(data, count):
+    values = []
+    offset = 0
+    for _ in range(count):
+        (length,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        values.append(bytes(data[offset:offset + length]).decode("utf-8", "surrogateescape"))
+        offset += length
+    return values
+
+def _micros(column):
+    return array("q", (round(value * 1_000_000) for value in column))
+
+def write_inventory(inventory, path):
+    """Write a ColumnarInventory to path in the binary columnar format, atomically."""
+    # Sorted directories share long prefixes; remap ids to the sorted order
+    order = sorted(range(len(inventory.dirs)), key=inventory.dirs.__getitem__)
+    remap = array("I", bytes(4 * len(order)))
+    for new_id, old_id in enumerate(order):
+        remap[old_id] = new_id
+
+    sections = {
+        "dirs": _encode_dirs(inventory.dirs[i] for i in order),
+        "extensions": _encode_strings(inventory.extensions),
+        "dir_ids": array("I", (remap[i] for i in inventory.dir_ids)).tobytes(),
+        "ext_ids": array("I", inventory.ext_ids).tobytes(),
+        "sizes": array("q", inventory.sizes).tobytes(),
+        "ctimes": _micros(inventory.ctimes).tobytes(),
+        "mtimes": _micros(inventory.mtimes).tobytes(),
+        "atimes": _micros(inventory.atimes).tobytes(),
+        "name_ends": array("Q", inventory._name_ends).tobytes(),
+        "names": bytes(inventory._names),
+    }
+
+    offset = HEADER.size + SECTION.size * len(SECTIONS)
+    table = []
+    for name in SECTIONS:
+        offset += -offset % 8
+        table.append((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, sys.byteorder == "little", len(inventory),
+                            len(inventory.dirs), len(inventory.extensions)))
+        for entry in table:
+            f.write(SECTION.pack(*entry))
+        for name, (section_offset, _) in zip(SECTIONS, table):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(sections[name])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class MappedInventory:
+    """Read-only, memory-mapped view of an inventory file.
+
+    Opening only parses the header; columns are memoryviews over the map, so
+    any row can be read without touching the rest of the file. The
+    directory table is decoded on first use.
+    """
+
+    def __init__(self, path):
+        self.file_path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little_endian, self._count, self._dir_count, self._ext_count = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} inventory file")
+        if bool(little_endian) != (sys.byteorder == "little"):
+            raise ValueError(f"{path} was written on a machine with a different byte order")
+
+        self._view = memoryview(self._map)
+        self._sections = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(self._map, HEADER.size + i * SECTION.size)
+            self._sections[name] = self._view[offset:offset + length]
+        for name, typecode in COLUMN_TYPES.items():
+            setattr(self, name, self._sections[name].cast(typecode))
+        self._dirs = None
+        self.extensions = _decode_strings(self._sections["extensions"], self._ext_count)
+
+    def close(self):
+        for name in COLUMN_TYPES:
+            getattr(self, name).release()
+        for section in self._sections.values():
+            section.release()
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def dirs(self):
+        if self._dirs is None:
+            self._dirs = _decode_dirs(self._sections["dirs"], self._dir_count)
+        return self._dirs
+
+    def name(self, i):
+        start = self.name_ends[i - 1] if i else 0
+        return os.fsdecode(bytes(self._sections["names"][start:self.name_ends[i]]))
+
+    def path(self, i):
+        return os.path.join(self.dirs[self.dir_ids[i]], self.name(i))
+
+    def extension(self, i):
+        return self.extensions[self.ext_ids[i]]
+
+    def record(self, i, time_format="default"):
+        # Times are stored as integer microseconds
+        return _file_record(
+            self.path(i), self.sizes[i], self.ctimes[i] / 1_000_000, self.mtimes[i] / 1_000_000,
+            self.atimes[i] / 1_000_000, time_format,
+        )
+
+    def records(self, indices=None, time_format="default"):
+        for i in (range(len(self)) if indices is None else indices):
+            yield self.record(i, time_format)
+
+    def to_inventory(self):
+        """Copy into a ColumnarInventory for bulk queries."""
+        inventory = ColumnarInventory()
+        inventory.dirs = list(self.dirs)
+        inventory._dir_ids = {directory: i for i, directory in enumerate(inventory.dirs)}
+        inventory.extensions = list(self.extensions)
+        inventory._ext_ids = {ext: i for i, ext in enumerate(inventory.extensions)}
+        inventory.dir_ids = array("I", self.dir_ids)
+        inventory.ext_ids = array("I", self.ext_ids)
+        inventory.sizes = array("q", self.sizes)
+        inventory.ctimes = array("d", (value / 1_000_000 for value in self.ctimes))
+        inventory.mtimes = array("d", (value / 1_000_000 for value in self.mtimes))
+        inventory.atimes = array("d", (value / 1_000_000 for value in self.atimes))
+        inventory._names = bytearray(self._sections["names"])
+        inventory._name_ends = array("Q", self.name_ends)
+        return inventory
+
+def json_to_inventory_file(json_path, path):
+    """Convert a file_details.json style {".ext": [records]} document to the binary format."""
+    inventory = load_inventory(json_path)
+    write_inventory(inventory, path)
+    return inventory
+
+def inventory_file_to_json(path, json_path):
+    """Write an inventory file back out in the file_details.json shape."""
+    grouped = {}
+    with MappedInventory(path) as inventory:
+        for i in range(len(inventory)):
+            name = inventory.name(i)
+            grouped.setdefault(inventory.extension(i), []).append({
+                "file_path": inventory.path(i),
+                "file_name": name,
+                "file_size": inventory.sizes[i],
+                "date_created": datetime.fromtimestamp(inventory.ctimes[i] / 1_000_000).isoformat(),
+                "date_modified": datetime.fromtimestamp(inventory.mtimes[i] / 1_000_000).isoformat(),
+                "date_accessed": datetime.fromtimestamp(inventory.atimes[i] / 1_000_000).isoformat(),
+            })
+    with open(json_path, "w") as f:
+        json.dump(grouped, f, indent=4)
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+def directory_fingerprint(directory):
+    """mtimes of directory and its top-level subdirectories, used to detect changes cheaply.
+
+    Adding, removing or renaming an entry directly inside any of these
+    directories changes the fingerprint; edits deeper down do not, which is
+    what the TTL is for.
+    """
+    mtimes = [('.', os.stat(directory).st_mtime_ns)]
+    with os.scandir(directory) as it:
+        for entry in sorted(it, key=lambda entry: entry.name):
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    mtimes.append((entry.name, entry.stat(follow_symlinks=False).st_mtime_ns))
+            except OSError:
+                continue
+    return tuple(mtimes)
+
+class ScanCache:
+    """In-process LRU cache of scan results with a TTL and mtime-based invalidation."""
+
+    def __init__(self, max_entries=128, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(directory, params):
+        """Normalize the directory and canonicalize params so equivalent requests share a key."""
+        return os.path.realpath(directory), json.dumps(params, sort_keys=True, default=str)
+
+    def get(self, directory, params):
+        key = self.make_key(directory, params)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return self._miss()
+
+        created_at, fingerprint, value = entry
+        try:
+            current = directory_fingerprint(key[0])
+        except OSError:
+            current = None
+        if time.monotonic() - created_at > self.ttl or current != fingerprint:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                    self.invalidations += 1
+            return self._miss()
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, directory, params, value, fingerprint=None):
+        """Store value; pass the fingerprint taken before the scan so changes during it invalidate."""
+        key = self.make_key(directory, params)
+        if fingerprint is None:
+            fingerprint = directory_fingerprint(key[0])
+        with self._lock:
+            self._entries[key] = (time.monotonic(), fingerprint, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
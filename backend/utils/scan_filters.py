@@ -0,0 +1,84 @@
+import fnmatch
+import os
+import re
+from datetime import datetime
+
+def _all_of(checks):
+    """Fold a list of predicates into one closure, or None when there is nothing to check."""
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value):
+        for check in checks:
+            if not check(value):
+                return False
+        return True
+    return check_all
+
+def _pattern(globs=None, regexes=None):
+    """Compile glob and regex patterns into a single regex searched against file names."""
+    parts = [f"^(?:{fnmatch.translate(glob)})" for glob in globs or ()]
+    parts += [f"(?:{regex})" for regex in regexes or ()]
+    return re.compile("|".join(parts)) if parts else None
+
+def _epoch(value):
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+def compile_name_filter(exclude_hidden=True, exclude_pyc=True, exclude_init=True, extensions=None,
+                        include=None, exclude=None, include_regex=None, exclude_regex=None):
+    """Build the file name check applied before a file is stat'ed.
+
+    include/exclude are glob patterns and include_regex/exclude_regex regular
+    expressions, all matched against the file name. Only enabled checks end
+    up in the returned closure; None means every name is accepted.
+    """
+    checks = []
+    if exclude_hidden:
+        checks.append(lambda name: not name.startswith('.'))
+    if exclude_pyc:
+        checks.append(lambda name: not name.endswith('.pyc'))
+    if exclude_init:
+        checks.append(lambda name: name != '__init__.py')
+    if extensions:
+        wanted = frozenset(ext.lower() for ext in extensions)
+        splitext = os.path.splitext
+        checks.append(lambda name: splitext(name)[1].lower() in wanted)
+
+    included = _pattern(include, include_regex)
+    if included is not None:
+        search = included.search
+        checks.append(lambda name: search(name) is not None)
+    excluded = _pattern(exclude, exclude_regex)
+    if excluded is not None:
+        search_excluded = excluded.search
+        checks.append(lambda name: search_excluded(name) is None)
+    return _all_of(checks)
+
+def _range_check(attr, date_range):
+    low, high = _epoch(date_range[0]), _epoch(date_range[1])
+    return lambda stat: low <= getattr(stat, attr) <= high
+
+def compile_stat_filter(min_size=None, max_size=None, date_created_range=None,
+                        date_modified_range=None, date_accessed_range=None):
+    """Build the size and date check run on each stat result.
+
+    Date ranges are (start, end) datetimes or epoch seconds, converted once
+    so every file is compared on its raw st_* values. Returns None when no
+    check is enabled.
+    """
+    checks = []
+    if min_size and max_size:
+        checks.append(lambda stat: min_size <= stat.st_size <= max_size)
+    elif min_size:
+        checks.append(lambda stat: stat.st_size >= min_size)
+    elif max_size:
+        checks.append(lambda stat: stat.st_size <= max_size)
+    if date_created_range:
+        checks.append(_range_check('st_ctime', date_created_range))
+    if date_modified_range:
+        checks.append(_range_check('st_mtime', date_modified_range))
+    if date_accessed_range:
+        checks.append(_range_check('st_atime', date_accessed_range))
+    return _all_of(checks)
@@ -0,0 +1,253 @@
+import os
+import sqlite3
+
+from backend.utils.file_scanner import _list_dir, error_record
+
+# Bump when the tables change; an index with another version is rebuilt.
+SCHEMA_VERSION = 3
+
+# Stat fields stored per file, in os.stat_result order.
+STAT_FIELDS = (
+    "st_mode", "st_ino", "st_dev", "st_nlink", "st_uid",
+    "st_gid", "st_size", "st_atime", "st_mtime", "st_ctime",
+)
+# Stored too, but only reachable by name on os.stat_result.
+EXTRA_STAT_FIELDS = ("st_blocks",)
+
+class IndexedEntry:
+    """Stand-in for os.DirEntry backed by a stat tuple stored in the index."""
+
+    __slots__ = ("name", "path", "_stat")
+
+    def __init__(self, name, path, stat):
+        self.name = name
+        self.path = path
+        self._stat = stat
+
+    def stat(self):
+        return self._stat
+
+def _subtree_bounds(path):
+    # Every descendant path sorts between "<path>/" and "<path>0" ('0' follows '/')
+    return path + os.sep, path + chr(ord(os.sep) + 1)
+
+class ScanIndex:
+    """On-disk SQLite index of directory mtimes and file stat tuples.
+
+    A directory whose mtime is unchanged since the last scan is served from
+    the index without listing it or stat'ing its files; only its
+    subdirectories are stat'ed to check their own mtimes. Directory mtimes
+    only move when entries are added, removed or renamed, so a file rewritten
+    in place keeps its indexed size and times until its directory changes or
+    the index is cleared.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.executescript("""
+                DROP TABLE IF EXISTS directories;
+                DROP TABLE IF EXISTS files;
+            """)
+        columns = ", ".join(
+            f"{field} {'REAL' if field.endswith('time') else 'INTEGER'}" for field in STAT_FIELDS + EXTRA_STAT_FIELDS
+        )
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                seq INTEGER,
+                mtime_ns INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+            CREATE TABLE IF NOT EXISTS files (
+                dir TEXT,
+                name TEXT,
+                seq INTEGER,
+                {columns},
+                PRIMARY KEY (dir, name)
+            );
+            CREATE TABLE IF NOT EXISTS content_types (
+                st_dev INTEGER,
+                st_ino INTEGER,
+                st_mtime REAL,
+                st_size INTEGER,
+                mime TEXT,
+                extension TEXT,
+                PRIMARY KEY (st_dev, st_ino)
+            );
+            PRAGMA user_version = {SCHEMA_VERSION};
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def clear(self):
+        """Forget everything, forcing the next scan to re-stat the whole tree."""
+        self.conn.execute("DELETE FROM directories")
+        self.conn.execute("DELETE FROM files")
+        self.conn.execute("DELETE FROM content_types")
+        self.conn.commit()
+
+    def _forget_subtree(self, path):
+        low, high = _subtree_bounds(path)
+        self.conn.execute("DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+        self.conn.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (path, low, high))
+
+    def _cached_listing(self, root, shown):
+        # Entries come back in the order the directory was listed in, with paths under shown
+        fields = STAT_FIELDS + EXTRA_STAT_FIELDS
+        files = [
+            IndexedEntry(name, os.path.join(shown, name), os.stat_result(
+                stat[:len(STAT_FIELDS)], dict(zip(EXTRA_STAT_FIELDS, stat[len(STAT_FIELDS):]))
+            ))
+            for name, *stat in self.conn.execute(
+                f"SELECT name, {', '.join(fields)} FROM files WHERE dir = ? ORDER BY seq", (root,)
+            )
+        ]
+        subdirs = [row[0] for row in self.conn.execute(
+            "SELECT path FROM directories WHERE parent = ? ORDER BY seq", (root,)
+        )]
+        return files, subdirs
+
+    def _refresh_listing(self, root, parent, mtime_ns, throttle=None, on_error=None, shown=None):
+        unreadable = []
+
+        def report(record):
+            unreadable.append(record)
+            if on_error is not None:
+                on_error(record)
+
+        # Listing the directory as the caller names it gives entries the caller's path form;
+        # rows are still keyed by the absolute root
+        files, subdirs = _list_dir(root if shown is None else shown, exclude_dirs=(), prefetch_stat=True,
+                                   throttle=throttle, on_error=report)
+        subdirs = [os.path.join(root, os.path.basename(subdir)) for subdir in subdirs]
+        # A directory that could not be listed keeps a NULL mtime, so it is retried (and reported) next time
+        if unreadable:
+            mtime_ns = None
+
+        rows = []
+        readable = []
+        for entry in files:
+            try:
+                stat = entry.stat()
+            except OSError as e:
+                if on_error is not None:
+                    on_error(error_record(entry.path, "stat", e))
+                continue
+            readable.append(entry)
+            rows.append((root, entry.name, len(rows),
+                         *(getattr(stat, field, None) for field in STAT_FIELDS + EXTRA_STAT_FIELDS)))
+        self.conn.execute("DELETE FROM files WHERE dir = ?", (root,))
+        self.conn.executemany(
+            f"INSERT INTO files VALUES (?, ?, ?, {', '.join('?' * len(STAT_FIELDS + EXTRA_STAT_FIELDS))})", rows
+        )
+
+        # Drop subdirectories that disappeared, together with everything below them
+        known = {row[0] for row in self.conn.execute("SELECT path FROM directories WHERE parent = ?", (root,))}
+        for gone in known.difference(subdirs):
+            self._forget_subtree(gone)
+
+        # New subdirectories get a NULL mtime so they are listed on first visit
+        self.conn.executemany(
+            "INSERT INTO directories (path, parent, seq, mtime_ns) VALUES (?, ?, ?, NULL) "
+            "ON CONFLICT (path) DO UPDATE SET parent = excluded.parent, seq = excluded.seq",
+            [(subdir, root, seq) for seq, subdir in enumerate(subdirs)],
+        )
+        self.conn.execute(
+            "INSERT INTO directories (path, parent, mtime_ns) VALUES (?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET parent = COALESCE(excluded.parent, parent), mtime_ns = excluded.mtime_ns",
+            (root, parent, mtime_ns),
+        )
+        return readable, subdirs
+
+    def cached_content_types(self, stats):
+        """Map (st_dev, st_ino) to a stored (MIME type, extension) for files unchanged since they were sniffed."""
+        found = {}
+        for stat in stats:
+            row = self.conn.execute(
+                "SELECT mime, extension FROM content_types "
+                "WHERE st_dev = ? AND st_ino = ? AND st_mtime = ? AND st_size = ?",
+                (stat.st_dev, stat.st_ino, stat.st_mtime, stat.st_size),
+            ).fetchone()
+            if row is not None:
+                found[(stat.st_dev, stat.st_ino)] = tuple(row)
+        return found
+
+    def store_content_types(self, results):
+        """Record (stat, (MIME type, extension)) pairs; one row per inode, replaced when the file changes."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO content_types VALUES (?, ?, ?, ?, ?, ?)",
+            [(stat.st_dev, stat.st_ino, stat.st_mtime, stat.st_size, *content_type) for stat, content_type in results],
+        )
+        self.conn.commit()
+
+    def iter_files(self, path, accept=None, exclude_dirs=('venv',), on_directory=None, throttle=None,
+                   one_filesystem=False, on_error=None):
+        """Yield file entries under path like file_scanner.iter_files, using the index.
+
+        Entry paths start with path as given and come in the order a walk
+        without the index yields them; the index itself is keyed by absolute
+        paths, so scans naming one tree differently share its rows. Every
+        visited directory is recorded, whatever accept and exclude_dirs
+        say, so scans with different filters share one index. With
+        one_filesystem, directories on another device than path are skipped
+        using the stat every directory gets anyway. Directories and files
+        that cannot be read are passed to on_error as error_records.
+        """
+        top = os.path.abspath(path)
+        device = None
+        changed = 0
+        try:
+            stack = [(top, path, None)]
+            while stack:
+                root, shown, parent = stack.pop()
+                try:
+                    stat = os.stat(root) if throttle is None else throttle.call(os.stat, root)
+                    mtime_ns = stat.st_mtime_ns
+                except OSError as e:
+                    if on_error is not None:
+                        on_error(error_record(shown, "stat", e))
+                    self._forget_subtree(root)
+                    continue
+                if one_filesystem:
+                    if device is None:
+                        device = stat.st_dev
+                    elif stat.st_dev != device:
+                        continue
+
+                row = self.conn.execute("SELECT mtime_ns FROM directories WHERE path = ?", (root,)).fetchone()
+                if row and row[0] == mtime_ns:
+                    files, subdirs = self._cached_listing(root, shown)
+                else:
+                    files, subdirs = self._refresh_listing(root, parent, mtime_ns, throttle, on_error, shown)
+                    changed += 1
+                    if changed % 500 == 0:
+                        self.conn.commit()
+                if on_directory is not None:
+                    on_directory(shown)
+
+                for entry in files:
+                    if accept is None or accept(entry.name):
+                        yield entry
+                stack.extend(
+                    (subdir, os.path.join(shown, os.path.basename(subdir)), root) for subdir in reversed(subdirs)
+                    if os.path.basename(subdir) not in exclude_dirs
+                )
+        finally:
+            self.conn.commit()
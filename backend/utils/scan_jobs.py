@@ -0,0 +1,280 @@
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.utils.checkpoint import ScanCheckpoint, discard_checkpoint
+from backend.utils.disk_usage import SizeTotals
+from backend.utils.file_scanner import FileRecord, _scan_entries
+from backend.utils.scan_index import ScanIndex
+from backend.utils.trends import TrendSummary, record_trends
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept around for result retrieval before the oldest are dropped
+MAX_FINISHED_JOBS = int(os.getenv("SCAN_JOB_HISTORY", 50))
+# Per-entry errors kept per job for the results endpoint; all of them are counted
+MAX_JOB_ERRORS = 1000
+# Matches are spilled to a temporary file here (the system temp directory by default), not kept in memory
+SCAN_RESULTS_DIR = os.getenv("SCAN_RESULTS_DIR") or None
+# Rows between remembered offsets in a results file; a page read skips at most this many rows
+RESULTS_STRIDE = 1000
+# Largest page of results one request may ask for
+MAX_PAGE_SIZE = 10000
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SCAN_JOB_WORKERS", 2)), thread_name_prefix="scan-job")
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+# Options that narrow a scan to some of the files; such scans are not recorded as trends
+NARROWING_OPTIONS = ("extensions", "min_size", "max_size", "include", "exclude", "include_regex", "exclude_regex",
+                     "date_created_range", "date_modified_range", "date_accessed_range")
+# Options that only change how fast a scan runs, so a checkpoint can be resumed without them
+SPEED_OPTIONS = ("throttle", "workers", "ordered")
+
+def checkpoint_options(scan_options):
+    """The scan options a checkpoint has to match, i.e. those that change which files are found."""
+    return {option: value for option, value in scan_options.items() if option not in SPEED_OPTIONS}
+
+class _Cancelled(Exception):
+    pass
+
+class ScanJob:
+    """A scan_directory walk running on the background executor.
+
+    Matching files are written to an unnamed temporary file, one JSON row
+    each, so results can be paged through once the job has completed while
+    memory only holds an offset every RESULTS_STRIDE rows. The file goes
+    away when the job fails, is cancelled or is dropped. Progress counters are plain attributes
+    updated by the worker thread and read without locking. With a
+    trends_path, a completed scan of the whole tree is recorded in that
+    TrendStore. With a checkpoint_path the walk is checkpointed there and a
+    job submitted again for the same scan, for instance after a restart,
+    resumes it; cancelling the job discards its checkpoint. Files that
+    cannot be read are counted as errors and skipped.
+    """
+
+    def __init__(self, directory, scan_options=None, index_path=None, dedupe_hardlinks=True, trends_path=None,
+                 checkpoint_path=None):
+        self.id = str(uuid.uuid4())
+        # A checkpoint saves its root and pending stack as absolute paths, so checkpointed walks start from one
+        self.directory = os.path.abspath(directory) if checkpoint_path else directory
+        self.scan_options = scan_options or {}
+        self.index_path = index_path
+        self.trends_path = trends_path
+        self.checkpoint_path = checkpoint_path
+        self.resumed = False
+        self.status = "pending"
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.directories_visited = 0
+        self.files_matched = 0
+        self.bytes_seen = 0
+        # Disk consumption of the matches, each hardlinked inode counted once
+        self.totals = SizeTotals(dedupe_hardlinks)
+        self._results = None
+        self._offsets = [0]
+        self._results_lock = threading.Lock()
+        self.errors = []
+        self.error_count = 0
+        self._cancelled = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "cancelled", "failed")
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.status == "pending":
+            self.status = "cancelled"
+            self.finished_at = time.time()
+            if self.checkpoint_path:
+                discard_checkpoint(self.checkpoint_path)
+
+    def _count_directory(self, directory):
+        # Checked per directory too, so long stretches without matches still stop promptly
+        if self._cancelled.is_set():
+            raise _Cancelled()
+        self.directories_visited += 1
+
+    def _add_result(self, file_path, stat):
+        if self._results is None:
+            self._results = tempfile.TemporaryFile(prefix="scan-results-", dir=SCAN_RESULTS_DIR)
+        elif self.files_matched % RESULTS_STRIDE == 0:
+            self._offsets.append(self._results.tell())
+        row = [file_path, stat.st_size, stat.st_ctime, stat.st_mtime, stat.st_atime]
+        self._results.write(json.dumps(row).encode() + b"\n")
+
+    def close(self):
+        """Remove the results file; the job keeps its counters but no longer serves pages."""
+        with self._results_lock:
+            if self._results is not None:
+                self._results.close()
+                self._results = None
+
+    def _record_error(self, record):
+        self.error_count += 1
+        if len(self.errors) < MAX_JOB_ERRORS:
+            self.errors.append(record)
+
+    def run(self):
+        if self._cancelled.is_set():
+            return
+        self.status = "running"
+        self.started_at = time.time()
+        index = ScanIndex(self.index_path) if self.index_path else None
+        narrowed = any(self.scan_options.get(option) for option in NARROWING_OPTIONS)
+        summary = TrendSummary(self.directory) if self.trends_path and not narrowed else None
+        checkpoint = None
+        try:
+            if self.checkpoint_path:
+                checkpoint = ScanCheckpoint(self.checkpoint_path, self.directory,
+                                            checkpoint_options(self.scan_options))
+                self.resumed = checkpoint.resumed
+            for file_path, stat in _scan_entries(
+                self.directory, index=index, on_directory=self._count_directory, on_error=self._record_error,
+                checkpoint=checkpoint, **self.scan_options
+            ):
+                if self._cancelled.is_set():
+                    raise _Cancelled()
+                self._add_result(file_path, stat)
+                self.files_matched += 1
+                self.bytes_seen += stat.st_size
+                self.totals.add(stat)
+                if summary is not None:
+                    summary.add(file_path, stat.st_size)
+            if self._results is not None:
+                self._results.flush()
+            self.status = "completed"
+            if summary is not None:
+                record_trends(self.trends_path, summary)
+        except _Cancelled:
+            self.status = "cancelled"
+            if checkpoint is not None:
+                checkpoint.discard()
+        except Exception as e:
+            logger.error(f"Scan job {self.id} failed: {e}")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+            if index is not None:
+                index.close()
+            if self.status != "completed":
+                self.close()
+            if checkpoint is not None:
+                # Keeps the last saved state unless the walk completed
+                checkpoint.close()
+            if self.scan_options.get("throttle") is not None:
+                # Executor threads are reused, so the next job must not inherit idle I/O priority
+                self.scan_options["throttle"].restore()
+
+    def progress(self):
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "directory": self.directory,
+            "status": self.status,
+            "error": self.error,
+            "directories_visited": self.directories_visited,
+            "files_matched": self.files_matched,
+            "bytes_seen": self.bytes_seen,
+            "allocated_bytes": self.totals.allocated_bytes,
+            "unique_bytes": self.totals.apparent_bytes,
+            "hardlinks_skipped": self.totals.to_dict()["hardlinks_skipped"],
+            "entry_errors": self.error_count,
+            "resumed": self.resumed,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_second": round(self.files_matched / elapsed, 1) if elapsed else 0.0,
+            "bytes_per_second": round(self.bytes_seen / elapsed, 1) if elapsed else 0.0,
+            **({"throttle": self.scan_options["throttle"].progress()} if self.scan_options.get("throttle") else {}),
+        }
+
+    def page(self, page=1, size=100, time_format='default'):
+        """Records page (counted from 1) of a completed job's results, size to a page."""
+        if page < 1 or size < 1:
+            raise ValueError("page and size must be at least 1")
+        start = (page - 1) * size
+        if start >= self.files_matched:
+            return []
+        records = []
+        with self._results_lock:
+            if self._results is None:
+                return []
+            stride, skip = divmod(start, RESULTS_STRIDE)
+            self._results.seek(self._offsets[stride])
+            for i, line in enumerate(self._results):
+                if i >= skip + size:
+                    break
+                if i >= skip:
+                    records.append(FileRecord(*json.loads(line)).to_dict(time_format))
+        return records
+
+def _prune_finished():
+    finished = [job_id for job_id, job in _jobs.items() if job.finished]
+    for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+        _jobs.pop(job_id).close()
+
+def submit_job(directory, scan_options=None, index_path=None, dedupe_hardlinks=True, trends_path=None,
+               checkpoint_path=None):
+    """Queue a scan of directory and return its ScanJob right away.
+
+    A job still running on the same checkpoint is returned instead, since
+    two walks cannot share one.
+    """
+    job = ScanJob(directory, scan_options, index_path, dedupe_hardlinks, trends_path, checkpoint_path)
+    with _jobs_lock:
+        if checkpoint_path is not None:
+            for running in _jobs.values():
+                if running.checkpoint_path == checkpoint_path and not running.finished:
+                    return running
+        _prune_finished()
+        _jobs[job.id] = job
+    _executor.submit(job.run)
+    return job
+
+def resume_jobs(checkpoint_dir, trends_path=None):
+    """Resubmit every scan with a checkpoint in checkpoint_dir; ones already running are returned as they are.
+
+    Throttles are not saved in checkpoints, so resumed scans run unthrottled.
+    Checkpoints that are incomplete or abandoned are removed instead, as
+    are results files of scans that crashed before their first save.
+    """
+    with _jobs_lock:
+        active = {job.checkpoint_path for job in _jobs.values() if not job.finished}
+    for results_path in glob.glob(os.path.join(checkpoint_dir, "*.json.results")):
+        path = results_path[:-len(".results")]
+        if path not in active and not os.path.exists(path):
+            discard_checkpoint(path)
+
+    jobs = []
+    for path in sorted(glob.glob(os.path.join(checkpoint_dir, "*.json"))):
+        state = ScanCheckpoint.read_resumable(path)
+        if state is None:
+            discard_checkpoint(path)
+            continue
+        jobs.append(submit_job(state["root"], state["options"], trends_path=trends_path, checkpoint_path=path))
+    return jobs
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def remove_job(job_id):
+    """Cancel a job; a job that has already finished is forgotten instead."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None and job.finished:
+            del _jobs[job_id]
+            job.close()
+    if job is not None:
+        job.cancel()
+    return job
@@ -0,0 +1,216 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.utils.file_scanner import TIME_FORMATS, _list_dir, iter_files
+from backend.utils.scan_filters import compile_name_filter, compile_stat_filter
+
+MANIFEST = "manifest.json"
+# Held for the whole of a build, so builds into one out_dir run one at a time
+BUILD_LOCK = ".build.lock"
+# Shard files a worker keeps open at once; older ones are closed and reopened for append
+MAX_OPEN_SHARDS = 128
+
+def _snapshot_record(file_path, stat):
+    """Record in the file_details.json shape: file name included, ISO timestamps."""
+    iso = TIME_FORMATS['iso']
+    return {
+        "file_path": file_path,
+        "file_name": os.path.basename(file_path),
+        "file_size": stat.st_size,
+        "date_created": iso(stat.st_ctime),
+        "date_modified": iso(stat.st_mtime),
+        "date_accessed": iso(stat.st_atime),
+    }
+
+class _ShardWriter:
+    """Append NDJSON records to one shard file per key, with a bounded set of open handles."""
+
+    def __init__(self, directory, part):
+        self.directory = directory
+        self.part = part
+        self.shards = {}
+        self._open = OrderedDict()
+
+    def write(self, key, record):
+        shard = self.shards.get(key)
+        if shard is None:
+            shard = self.shards[key] = {"file": f"part{self.part}-{len(self.shards)}.ndjson", "count": 0, "bytes": 0}
+        handle = self._open.get(key)
+        if handle is None:
+            if len(self._open) >= MAX_OPEN_SHARDS:
+                self._open.popitem(last=False)[1].close()
+            handle = self._open[key] = open(os.path.join(self.directory, shard["file"]), "a", encoding="utf-8")
+        else:
+            self._open.move_to_end(key)
+        handle.write(json.dumps(record) + "\n")
+        shard["count"] += 1
+        shard["bytes"] += record["file_size"]
+
+    def close(self):
+        for handle in self._open.values():
+            handle.flush()
+            os.fsync(handle.fileno())
+            handle.close()
+        self._open.clear()
+
+def _shard_key(record, shard_by, buckets):
+    if shard_by == "hash":
+        return f"bucket-{zlib.crc32(os.fsencode(record['file_path'])) % buckets:04d}"
+    return os.path.splitext(record["file_name"])[1].lower()
+
+def _write_part(part, directory, root, include_root_files, subdirs, shard_by, buckets, scan_options):
+    """Walk one share of the tree and write its shards; returns {key: shard info}."""
+    name_options = {key: scan_options[key] for key in (
+        "exclude_hidden", "exclude_pyc", "exclude_init", "extensions",
+        "include", "exclude", "include_regex", "exclude_regex",
+    ) if key in scan_options}
+    stat_options = {key: scan_options[key] for key in (
+        "min_size", "max_size", "date_created_range", "date_modified_range", "date_accessed_range",
+    ) if key in scan_options}
+    accept = compile_name_filter(**name_options)
+    check = compile_stat_filter(**stat_options)
+
+    def entries():
+        if include_root_files:
+            yield from _list_dir(root, accept)[0]
+        for subdir in subdirs:
+            yield from iter_files(subdir, accept=accept)
+
+    writer = _ShardWriter(directory, part)
+    try:
+        for entry in entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if check is None or check(stat):
+                record = _snapshot_record(entry.path, stat)
+                writer.write(_shard_key(record, shard_by, buckets), record)
+    finally:
+        writer.close()
+    return writer.shards
+
+def _split_work(subdirs, workers):
+    """Spread top-level directories over workers, largest listings first, to balance the parts."""
+    parts = [[] for _ in range(workers)]
+    loads = [0] * workers
+    weighted = []
+    for subdir in subdirs:
+        try:
+            weight = len(os.listdir(subdir)) + 1
+        except OSError:
+            weight = 1
+        weighted.append((weight, subdir))
+    for weight, subdir in sorted(weighted, reverse=True):
+        target = loads.index(min(loads))
+        parts[target].append(subdir)
+        loads[target] += weight
+    return parts
+
+def build_snapshot(path, out_dir, workers=None, shard_by="extension", buckets=16, **scan_options):
+    """Scan path into a sharded snapshot under out_dir and return its manifest.
+
+    Top-level directories are split across worker processes, each streaming
+    its files into one NDJSON shard per extension (or per hash bucket with
+    shard_by="hash"). Shards go into a fresh snapshot directory and the
+    manifest is swapped in last, so readers only ever see complete
+    snapshots. Accepts the scan_directory filters.
+
+    Builds into the same out_dir wait for each other, and each one only
+    removes the snapshot the manifest it replaced pointed to.
+    """
+    if shard_by not in ("extension", "hash"):
+        raise ValueError(f"Unsupported shard_by: {shard_by}. Expected 'extension' or 'hash'.")
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, BUILD_LOCK), "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        return _build_snapshot(path, out_dir, workers, shard_by, buckets, scan_options)
+
+def _build_snapshot(path, out_dir, workers, shard_by, buckets, scan_options):
+    workers = workers or os.cpu_count() or 1
+    snapshot_id = f"snapshot-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    snapshot_dir = os.path.join(out_dir, snapshot_id)
+    os.makedirs(snapshot_dir)
+
+    subdirs = _list_dir(path)[1]
+    parts = _split_work(subdirs, workers)
+    tasks = [
+        (part, snapshot_dir, path, part == 0, part_subdirs, shard_by, buckets, scan_options)
+        for part, part_subdirs in enumerate(parts) if part == 0 or part_subdirs
+    ]
+
+    started = time.time()
+    try:
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_write_part, *zip(*tasks)))
+        else:
+            results = [_write_part(*task) for task in tasks]
+    except BaseException:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        raise
+
+    shards = {}
+    for part_shards in results:
+        for key, shard in part_shards.items():
+            shards.setdefault(key, []).append(shard)
+
+    manifest = {
+        "snapshot": snapshot_id,
+        "root": os.path.abspath(path),
+        "shard_by": shard_by,
+        "created_at": time.time(),
+        "build_seconds": round(time.time() - started, 3),
+        "total_files": sum(shard["count"] for part in shards.values() for shard in part),
+        "total_bytes": sum(shard["bytes"] for part in shards.values() for shard in part),
+        "shards": shards,
+    }
+    try:
+        previous = read_manifest(out_dir).get("snapshot")
+    except (OSError, ValueError):
+        previous = None
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    # The replaced snapshot is unreachable once the new manifest is in place
+    if previous and previous != snapshot_id and os.sep not in previous:
+        shutil.rmtree(os.path.join(out_dir, previous), ignore_errors=True)
+    return manifest
+
+def read_manifest(out_dir):
+    with open(os.path.join(out_dir, MANIFEST)) as f:
+        return json.load(f)
+
+def _read_shard(shard_path):
+    with open(shard_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def iter_snapshot(out_dir, key=None):
+    """Stream records from a snapshot, optionally from a single extension or bucket."""
+    manifest = read_manifest(out_dir)
+    keys = [key] if key is not None else list(manifest["shards"])
+    for shard_key in keys:
+        for shard in manifest["shards"].get(shard_key, []):
+            with open(os.path.join(out_dir, manifest["snapshot"], shard["file"]), encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+
+def load_snapshot_key(out_dir, key, workers=None):
+    """Read every shard of one extension (or bucket) on a process pool and return its records."""
+    manifest = read_manifest(out_dir)
+    paths = [os.path.join(out_dir, manifest["snapshot"], shard["file"]) for shard in manifest["shards"].get(key, [])]
+    if len(paths) <= 1 or workers == 1:
+        return [record for path in paths for record in _read_shard(path)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [record for records in pool.map(_read_shard, paths) for record in records]
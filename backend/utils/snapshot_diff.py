@@ -0,0 +1,259 @@
+import heapq
+import json
+import os
+import tempfile
+import time
+from itertools import islice
+
+from backend.utils.file_scanner import _list_dir
+from backend.utils.inventory import _parse_time
+from backend.utils.scan_filters import compile_name_filter, compile_stat_filter
+
+# Sorted snapshots are text files: a header line, then "size<TAB>mtime<TAB>path" per file in sort_key order
+FORMAT = "sorted-snapshot"
+VERSION = 1
+# Records held in memory per run when sorting an unsorted source
+SORT_CHUNK = 200_000
+
+_SEP = os.fsencode(os.sep)
+
+def sort_key(file_path):
+    """Bytes key that orders paths the way a sorted depth-first walk visits them.
+
+    A directory's own files come before anything in its subdirectories, and
+    siblings sort by name. Directory separators become b"\\x01" and the file
+    name is prefixed with b"\\x00", so plain bytes comparison does the job.
+    Working on the encoded path keeps the order identical for names that
+    are not valid UTF-8.
+    """
+    directory, _, name = os.fsencode(file_path).rpartition(_SEP)
+    return directory.replace(_SEP, b"\x01") + b"\x01\x00" + name
+
+def _escape(file_path):
+    if "\\" in file_path or "\n" in file_path:
+        return file_path.replace("\\", "\\\\").replace("\n", "\\n")
+    return file_path
+
+def _unescape(file_path):
+    """Undo _escape on an encoded path read back from a snapshot."""
+    return file_path.replace(b"\\\\", b"\0").replace(b"\\n", b"\n").replace(b"\0", b"\\")
+
+def _header(root):
+    return "# " + json.dumps({"format": FORMAT, "version": VERSION, "root": root, "created_at": time.time()}) + "\n"
+
+def _open_for_writing(path):
+    return open(path, "w", encoding="utf-8", errors="surrogateescape", newline="\n")
+
+def _write_rows(out_path, root, rows):
+    """Write (path, size, mtime) rows, already in sort order, atomically; returns the row count."""
+    count = 0
+    tmp_path = f"{out_path}.tmp"
+    with _open_for_writing(tmp_path) as f:
+        f.write(_header(root))
+        for file_path, size, mtime in rows:
+            f.write(f"{size}\t{mtime!r}\t{_escape(file_path)}\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, out_path)
+    return count
+
+def iter_sorted_files(path, exclude_hidden=True, exclude_pyc=True, exclude_init=True, extensions=None,
+                      min_size=None, max_size=None, date_modified_range=None):
+    """Walk path depth-first with sorted listings, yielding (path, size, mtime) in sort_key order."""
+    accept = compile_name_filter(exclude_hidden, exclude_pyc, exclude_init, extensions)
+    check = compile_stat_filter(min_size, max_size, date_modified_range=date_modified_range)
+    stack = [path]
+    while stack:
+        root = stack.pop()
+        files, subdirs = _list_dir(root, accept)
+        for entry in sorted(files, key=lambda entry: os.fsencode(entry.name)):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if check is None or check(stat):
+                yield entry.path, stat.st_size, stat.st_mtime
+        stack.extend(sorted(subdirs, key=os.fsencode, reverse=True))
+
+def write_sorted_snapshot(path, out_path, **scan_options):
+    """Scan path straight into a sorted snapshot file; returns the number of files written."""
+    root = path.rstrip(os.sep) or os.sep
+    return _write_rows(out_path, root, iter_sorted_files(root, **scan_options))
+
+def sort_records(records, out_path, root, chunk_size=SORT_CHUNK):
+    """Write scan_directory or file_details.json style records as a sorted snapshot.
+
+    The records can come in any order (for example from
+    inventory_reader.iter_records); they are sorted in runs of chunk_size
+    spilled to temporary files and merged, so memory stays bounded.
+    """
+    def rows(chunk):
+        return ((record["file_path"], record["file_size"], _parse_time(record["date_modified"])) for record in chunk)
+
+    runs = []
+    try:
+        records = iter(records)
+        while True:
+            chunk = sorted(rows(islice(records, chunk_size)), key=lambda row: sort_key(row[0]))
+            if not chunk:
+                break
+            fd, run_path = tempfile.mkstemp(suffix=".sorted")
+            os.close(fd)
+            runs.append(run_path)
+            _write_rows(run_path, root, chunk)
+        readers = [_read_rows(run_path) for run_path in runs]
+        merged = heapq.merge(*readers, key=lambda row: row[0])
+        return _write_rows(out_path, root, (
+            (os.fsdecode(file_path), size, float(mtime)) for _, file_path, size, mtime in merged
+        ))
+    finally:
+        for run_path in runs:
+            os.remove(run_path)
+
+def read_header(path):
+    with open(path, encoding="utf-8", errors="surrogateescape") as f:
+        line = f.readline()
+    if not line.startswith("# "):
+        raise ValueError(f"{path} is not a sorted snapshot")
+    header = json.loads(line[2:])
+    if header.get("format") != FORMAT or header.get("version") != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} sorted snapshot")
+    return header
+
+def _read_lines(path):
+    """Yield the raw row lines of a sorted snapshot, header skipped."""
+    read_header(path)
+    with open(path, "rb") as f:
+        next(f)
+        yield from f
+
+def _parse_row(line):
+    """(sort key, encoded path, size, mtime) of one raw row line.
+
+    Lines are split as bytes and paths only decoded by callers that need
+    them, which is most of the cost of a diff.
+    """
+    size, mtime, file_path = line.rstrip(b"\n").split(b"\t", 2)
+    if b"\\" in file_path:
+        file_path = _unescape(file_path)
+    directory, _, name = file_path.rpartition(_SEP)
+    return directory.replace(_SEP, b"\x01") + b"\x01\x00" + name, file_path, int(size), mtime
+
+def _read_rows(path):
+    """Yield (sort key, encoded path, size, mtime) from a sorted snapshot, one line at a time."""
+    return map(_parse_row, _read_lines(path))
+
+class _DirectoryDeltas:
+    """Recursive per-directory change totals over a depth-first stream, using memory proportional to depth.
+
+    stack holds the chain of directories from the root down to the one
+    being visited; leaving a directory emits its totals and folds them into
+    its parent.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.stack = [self._totals(root)]
+
+    @staticmethod
+    def _totals(directory):
+        return {"type": "directory", "path": directory, "files_added": 0, "files_removed": 0,
+                "bytes_added": 0, "bytes_removed": 0}
+
+    def _is_ancestor(self, ancestor, directory):
+        return directory == ancestor or directory.startswith(ancestor.rstrip(os.sep) + os.sep)
+
+    def _pop(self):
+        done = self.stack.pop()
+        if self.stack:
+            parent = self.stack[-1]
+            for key in ("files_added", "files_removed", "bytes_added", "bytes_removed"):
+                parent[key] += done[key]
+        return done
+
+    def _emit(self, totals):
+        if totals["files_added"] or totals["files_removed"] or totals["bytes_added"] or totals["bytes_removed"]:
+            yield {**totals, "bytes_delta": totals["bytes_added"] - totals["bytes_removed"]}
+
+    def enter(self, directory):
+        """Move to directory, yielding the totals of every directory left on the way."""
+        if directory == self.stack[-1]["path"]:
+            return
+        if not self._is_ancestor(self.root, directory):
+            directory = self.root
+        while len(self.stack) > 1 and not self._is_ancestor(self.stack[-1]["path"], directory):
+            yield from self._emit(self._pop())
+        missing = []
+        current = directory
+        while current != self.stack[-1]["path"]:
+            missing.append(current)
+            current = os.path.dirname(current)
+        for path in reversed(missing):
+            self.stack.append(self._totals(path))
+
+    def add(self, files_added=0, files_removed=0, bytes_added=0, bytes_removed=0):
+        totals = self.stack[-1]
+        totals["files_added"] += files_added
+        totals["files_removed"] += files_removed
+        totals["bytes_added"] += bytes_added
+        totals["bytes_removed"] += bytes_removed
+
+    def finish(self):
+        while self.stack:
+            yield from self._emit(self._pop())
+
+def diff_snapshots(old_path, new_path, directories=True):
+    """Stream the differences between two sorted snapshots with a single merge-join pass.
+
+    Yields {"type": "added" | "removed" | "grown" | "shrunk", ...} file
+    records in path order. With directories, recursive per-directory deltas
+    ({"type": "directory", ...}) are interleaved in post-order, each right
+    after the last change below that directory. Time is linear in the size
+    of both snapshots and memory is bounded by the depth of the tree.
+    """
+    root = read_header(new_path)["root"]
+    old_lines = _read_lines(old_path)
+    new_lines = _read_lines(new_path)
+    deltas = _DirectoryDeltas(root) if directories else None
+    old_line = next(old_lines, None)
+    new_line = next(new_lines, None)
+    old = new = None
+
+    while old_line is not None or new_line is not None:
+        # Identical lines (same path, size and mtime) are the bulk of any diff; skip them unparsed
+        if old_line == new_line:
+            old_line = next(old_lines, None)
+            new_line = next(new_lines, None)
+            old = new = None
+            continue
+        if old is None and old_line is not None:
+            old = _parse_row(old_line)
+        if new is None and new_line is not None:
+            new = _parse_row(new_line)
+
+        if new is None or (old is not None and old[0] < new[0]):
+            change = {"type": "removed", "file_path": os.fsdecode(old[1]), "old_size": old[2], "new_size": None}
+            counts = {"files_removed": 1, "bytes_removed": old[2]}
+            old_line, old = next(old_lines, None), None
+        elif old is None or new[0] < old[0]:
+            change = {"type": "added", "file_path": os.fsdecode(new[1]), "old_size": None, "new_size": new[2]}
+            counts = {"files_added": 1, "bytes_added": new[2]}
+            new_line, new = next(new_lines, None), None
+        else:
+            old_size, new_size, file_path = old[2], new[2], new[1]
+            old_line, old = next(old_lines, None), None
+            new_line, new = next(new_lines, None), None
+            if old_size == new_size:
+                continue
+            change = {"type": "grown" if new_size > old_size else "shrunk", "file_path": os.fsdecode(file_path),
+                      "old_size": old_size, "new_size": new_size}
+            counts = {"bytes_added": max(new_size - old_size, 0), "bytes_removed": max(old_size - new_size, 0)}
+
+        if deltas is not None:
+            yield from deltas.enter(os.path.dirname(change["file_path"]))
+            deltas.add(**counts)
+        yield change
+
+    if deltas is not None:
+        yield from deltas.finish()
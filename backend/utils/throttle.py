@@ -0,0 +1,213 @@
+import ctypes
+import logging
+import platform
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ioprio_set(2) syscall numbers; glibc has no wrapper for it. ioprio_get is always the next number.
+_IOPRIO_SET = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+    "s390x": 282,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+# Latency above this multiple of the baseline counts as the disk being under pressure
+LATENCY_FACTOR = 3.0
+# Latency that never counts as pressure; page-cache hits are microseconds and far below it
+LATENCY_FLOOR = 0.005
+# Weight of each new sample in the moving average of operation latency
+LATENCY_SMOOTHING = 0.1
+MIN_DELAY = 0.001
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+except OSError:
+    _libc = None
+
+def get_io_priority():
+    """The calling thread's raw I/O priority, or None where ioprio_get is unavailable."""
+    number = _IOPRIO_SET.get(platform.machine())
+    if _libc is None or number is None:
+        return None
+    # who=0 means the calling thread
+    priority = _libc.syscall(number + 1, IOPRIO_WHO_PROCESS, 0)
+    return priority if priority >= 0 else None
+
+def set_io_priority(priority):
+    """Set the calling thread's raw I/O priority; returns False where ioprio_set is unavailable or refused."""
+    number = _IOPRIO_SET.get(platform.machine())
+    if _libc is None or number is None:
+        return False
+    if _libc.syscall(number, IOPRIO_WHO_PROCESS, 0, priority) != 0:
+        logger.warning(f"ioprio_set failed with errno {ctypes.get_errno()}")
+        return False
+    return True
+
+def set_idle_io_priority():
+    """Put the calling thread in the idle I/O scheduling class.
+
+    Its disk requests are then only served when nobody else needs the disk.
+    Returns False where ioprio_set is unavailable (not Linux, unknown
+    architecture, or refused by the kernel).
+    """
+    return set_io_priority(IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT)
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens per second, holding at most burst.
+
+    acquire() reserves its tokens up front and sleeps off any deficit, so
+    waiting callers are served in order and large requests (more than
+    burst at once) simply wait longer.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            deficit = -self._tokens
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+
+class ScanThrottle:
+    """Rate limits and backoff for scans running next to latency-sensitive services.
+
+    stats_per_second caps directory listings and stat calls,
+    bytes_per_second caps bytes read for hashing. Every throttled call is
+    timed; while the moving average latency stays above LATENCY_FACTOR times
+    its baseline and above LATENCY_FLOOR (or above latency_target, in
+    seconds, when given), a delay is added before each call that doubles up
+    to max_delay and halves again once latency recovers. idle_priority moves each thread that does
+    throttled work into the idle I/O class; restore() puts the calling
+    thread back, which walks do when they end so pooled threads that run
+    later work are not left at idle priority.
+    """
+
+    def __init__(self, stats_per_second=None, bytes_per_second=None, idle_priority=False,
+                 latency_target=None, max_delay=1.0):
+        self.stats = TokenBucket(stats_per_second) if stats_per_second else None
+        self.bytes = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self.idle_priority = idle_priority
+        self.latency_target = latency_target
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.latency = None
+        self.baseline = None
+        self.calls = 0
+        self.throttled_seconds = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_options(cls, options):
+        """Build a throttle from request JSON, or None when no limit is asked for.
+
+        Raises ValueError unless the rates, latency_target and max_delay
+        that are given are positive numbers.
+        """
+        if not options:
+            return None
+        if not isinstance(options, dict):
+            raise ValueError("throttle must be an object")
+        limits = {}
+        for name in ("stats_per_second", "bytes_per_second", "latency_target", "max_delay"):
+            value = options.get(name)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+                raise ValueError(f"throttle {name} must be a positive number")
+            limits[name] = value
+        return cls(
+            stats_per_second=limits.get("stats_per_second"),
+            bytes_per_second=limits.get("bytes_per_second"),
+            idle_priority=bool(options.get("idle_priority", False)),
+            latency_target=limits.get("latency_target"),
+            max_delay=float(limits.get("max_delay", 1.0)),
+        )
+
+    def _prepare_thread(self):
+        if self.idle_priority and not getattr(self._local, "prepared", False):
+            self._local.prepared = True
+            self._local.saved = get_io_priority()
+            if self._local.saved is not None:
+                set_idle_io_priority()
+
+    def restore(self):
+        """Give the calling thread back the I/O priority it had before this throttle touched it."""
+        if getattr(self._local, "prepared", False):
+            self._local.prepared = False
+            if self._local.saved is not None:
+                set_io_priority(self._local.saved)
+
+    def _wait(self, bucket, amount):
+        started = time.monotonic()
+        if bucket is not None:
+            bucket.acquire(amount)
+        if self.delay:
+            time.sleep(self.delay)
+        return time.monotonic() - started
+
+    def call(self, func, *args):
+        """Run one stat-like operation under the rate limit and feed its latency to the backoff."""
+        self._prepare_thread()
+        waited = self._wait(self.stats, 1)
+        started = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            self._observe(time.monotonic() - started, waited)
+
+    def consume_bytes(self, amount):
+        """Account for amount bytes about to be read; blocks while over the byte rate."""
+        self._prepare_thread()
+        waited = self._wait(self.bytes, amount)
+        with self._lock:
+            self.throttled_seconds += waited
+
+    def _observe(self, latency, waited):
+        with self._lock:
+            self.calls += 1
+            self.throttled_seconds += waited
+            if self.latency is None:
+                self.latency = self.baseline = latency
+                return
+            self.latency += (latency - self.latency) * LATENCY_SMOOTHING
+            # The baseline follows improvements at once and degradations only very slowly
+            self.baseline = min(self.latency, self.baseline + (self.latency - self.baseline) * 0.001)
+            if self.latency_target is not None:
+                limit = self.latency_target
+            else:
+                limit = max(self.baseline * LATENCY_FACTOR, LATENCY_FLOOR)
+            if self.latency > limit:
+                self.delay = min(self.max_delay, max(self.delay * 2, MIN_DELAY))
+            elif self.delay:
+                self.delay = self.delay / 2 if self.delay / 2 >= MIN_DELAY else 0.0
+
+    def progress(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "latency_ms": round(self.latency * 1000, 3) if self.latency is not None else None,
+                "baseline_ms": round(self.baseline * 1000, 3) if self.baseline is not None else None,
+                "delay_ms": round(self.delay * 1000, 3),
+                "throttled_seconds": round(self.throttled_seconds, 3),
+            }
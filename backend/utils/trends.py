@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import time
+
+# Bump when the tables change; a store with another version is rebuilt.
+SCHEMA_VERSION = 1
+
+# Bucket widths in seconds, finest first, with how long each is kept (None: forever).
+# Every capture updates one bucket at each width, so coarser buckets are already
+# aggregated by the time the finer ones expire.
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+RETENTION = {60: 2 * 86400, 3600: 45 * 86400, 86400: None}
+# Most points a range query returns per series before a coarser width is chosen
+MAX_POINTS = 500
+
+# Series captured per scan: directories this many levels below the root, and
+# the largest directories and extensions; the rest are folded into TREND_OTHER
+TREND_DEPTH = 1
+MAX_DIRECTORIES = 50
+MAX_EXTENSIONS = 20
+TREND_OTHER = "(other)"
+KINDS = ("total", "directory", "extension")
+
+class TrendSummary:
+    """Per-directory and per-extension file counts and bytes of one scan, fed a file at a time.
+
+    Directory totals are recursive and kept for directories at most depth
+    levels below root; files directly inside root only count towards the
+    total. File paths may be relative to the working directory, as a walk
+    of a relative root yields them.
+    """
+
+    def __init__(self, root, depth=TREND_DEPTH):
+        self.root = os.path.abspath(root).rstrip(os.sep) or os.sep
+        self.depth = depth
+        self.total = [0, 0]
+        self.directories = {}
+        self.extensions = {}
+        self._prefix = self.root.rstrip(os.sep) + os.sep
+
+    def add(self, file_path, size):
+        self.total[0] += 1
+        self.total[1] += size
+        name = os.path.basename(file_path)
+        totals = self.extensions.setdefault(os.path.splitext(name)[1].lower(), [0, 0])
+        totals[0] += 1
+        totals[1] += size
+        if not os.path.isabs(file_path):
+            file_path = os.path.abspath(file_path)
+        if not file_path.startswith(self._prefix):
+            return
+        parts = file_path[len(self._prefix):].split(os.sep, self.depth)[:-1]
+        directory = self.root
+        for part in parts:
+            directory = os.path.join(directory, part)
+            totals = self.directories.setdefault(directory, [0, 0])
+            totals[0] += 1
+            totals[1] += size
+
+    @staticmethod
+    def _largest(totals, limit):
+        """The limit largest entries by bytes, with everything else summed under TREND_OTHER."""
+        ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        largest = dict(ranked[:limit])
+        if len(ranked) > limit:
+            largest[TREND_OTHER] = [sum(value[i] for _, value in ranked[limit:]) for i in range(2)]
+        return largest
+
+    def series(self, max_directories=MAX_DIRECTORIES, max_extensions=MAX_EXTENSIONS):
+        """(kind, name, files, bytes) for every series of this scan."""
+        yield "total", "", *self.total
+        for directory, (files, size) in self._largest(self.directories, max_directories).items():
+            yield "directory", directory, files, size
+        for extension, (files, size) in self._largest(self.extensions, max_extensions).items():
+            yield "extension", extension, files, size
+
+class TrendStore:
+    """SQLite time series of scan totals, one row per series and bucket.
+
+    A bucket holds the last files and bytes captured in it, the smallest
+    and largest byte totals, and the number of captures. Minute buckets
+    are dropped after two days and hour buckets after 45 days; day buckets
+    are kept for good, so a directory scanned every few minutes for years
+    costs a few rows per series per day.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.executescript("""
+                DROP TABLE IF EXISTS series;
+                DROP TABLE IF EXISTS points;
+            """)
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS series (
+                id INTEGER PRIMARY KEY,
+                root TEXT,
+                kind TEXT,
+                name TEXT,
+                UNIQUE (root, kind, name)
+            );
+            CREATE TABLE IF NOT EXISTS points (
+                series INTEGER,
+                resolution INTEGER,
+                bucket INTEGER,
+                files INTEGER,
+                bytes INTEGER,
+                min_bytes INTEGER,
+                max_bytes INTEGER,
+                samples INTEGER,
+                PRIMARY KEY (series, resolution, bucket)
+            ) WITHOUT ROWID;
+            PRAGMA user_version = {SCHEMA_VERSION};
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _series_id(self, root, kind, name):
+        self.conn.execute("INSERT OR IGNORE INTO series (root, kind, name) VALUES (?, ?, ?)", (root, kind, name))
+        return self.conn.execute(
+            "SELECT id FROM series WHERE root = ? AND kind = ? AND name = ?", (root, kind, name)
+        ).fetchone()[0]
+
+    def record(self, summary, timestamp=None):
+        """Fold a TrendSummary into the bucket containing timestamp at every resolution."""
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        rows = []
+        recorded = []
+        for kind, name, files, size in summary.series():
+            series = self._series_id(summary.root, kind, name)
+            recorded.append(series)
+            for width in RETENTION:
+                rows.append((series, width, timestamp - timestamp % width, files, size, size, size))
+        self.conn.executemany("""
+            INSERT INTO points (series, resolution, bucket, files, bytes, min_bytes, max_bytes, samples)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT (series, resolution, bucket) DO UPDATE SET
+                files = excluded.files,
+                bytes = excluded.bytes,
+                min_bytes = min(min_bytes, excluded.min_bytes),
+                max_bytes = max(max_bytes, excluded.max_bytes),
+                samples = samples + 1
+        """, rows)
+        self.downsample(recorded, timestamp)
+        self.conn.commit()
+
+    def downsample(self, series=None, now=None):
+        """Drop buckets past their retention; the coarser buckets covering them stay.
+
+        Only the given series ids are pruned (all of them by default), each
+        through its primary key range.
+        """
+        now = time.time() if now is None else now
+        if series is None:
+            series = [row[0] for row in self.conn.execute("SELECT id FROM series")]
+        self.conn.executemany(
+            "DELETE FROM points WHERE series = ? AND resolution = ? AND bucket < ?",
+            [(id, width, now - keep) for id in series for width, keep in RETENTION.items() if keep is not None],
+        )
+
+    def _pick_resolution(self, start, end, now):
+        for width, keep in RETENTION.items():
+            if (keep is None or start >= now - keep) and (end - start) / width <= MAX_POINTS:
+                return width
+        return max(RETENTION)
+
+    def query(self, root, kind="total", names=None, start=None, end=None, resolution=None):
+        """Points of the series of root between start and end (epoch seconds), oldest first.
+
+        Without a resolution the finest one that still covers start and
+        fits MAX_POINTS buckets is used. Returns {"resolution", "start",
+        "end", "series": {name: {"points", "change"}}}, where change is the
+        byte growth from the first point to the last.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+        now = time.time()
+        end = now if end is None else end
+        start = end - 7 * 86400 if start is None else start
+        if start > end:
+            raise ValueError("start must not be after end")
+        width = RESOLUTIONS[resolution] if resolution is not None else self._pick_resolution(start, end, now)
+
+        root = os.path.abspath(root).rstrip(os.sep) or os.sep
+        query = """
+            SELECT series.name, bucket, files, bytes, min_bytes, max_bytes, samples
+            FROM series JOIN points ON points.series = series.id
+            WHERE series.root = ? AND series.kind = ? AND resolution = ? AND bucket >= ? AND bucket <= ?
+        """
+        params = [root, kind, width, int(start) - int(start) % width, int(end)]
+        if names:
+            query += f" AND series.name IN ({', '.join('?' * len(names))})"
+            params.extend(names)
+        series = {}
+        for name, bucket, files, size, min_bytes, max_bytes, samples in self.conn.execute(
+            query + " ORDER BY series.name, bucket", params
+        ):
+            series.setdefault(name, {"points": []})["points"].append({
+                "time": bucket, "files": files, "bytes": size,
+                "min_bytes": min_bytes, "max_bytes": max_bytes, "samples": samples,
+            })
+        for values in series.values():
+            values["change"] = values["points"][-1]["bytes"] - values["points"][0]["bytes"]
+        resolution = next(name for name, value in RESOLUTIONS.items() if value == width)
+        return {"root": root, "kind": kind, "resolution": resolution, "start": start, "end": end, "series": series}
+
+def record_trends(db_path, summary, timestamp=None):
+    """Open the store at db_path just long enough to record one summary."""
+    with TrendStore(db_path) as store:
+        store.record(summary, timestamp)